@@ -1,10 +1,12 @@
 import os
-from groq import Groq
+from groq import AsyncGroq
 from dotenv import load_dotenv
 
+from work_limits import chat_limit
+
 load_dotenv()
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
 
 SYSTEM_PROMPT = """
 You are a professional AI Fitness Coach and Nutrition Assistant.
@@ -16,53 +18,59 @@ Rules:
 - Avoid medical claims
 """
 
-def ai_fitness_chat(user_message, food_context=None, chat_history=None):
-    try:
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT}
-        ]
+def build_messages(user_message, food_context=None, chat_history=None):
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT}
+    ]
 
-        # ✅ Inject food memory ONCE
-        if food_context:
-            messages.append({
-                "role": "system",
-                "content": f"""
+    # ✅ Inject food memory ONCE
+    if food_context:
+        messages.append({
+            "role": "system",
+            "content": f"""
 User food history (use this to personalize advice):
 {food_context}
 """
-            })
+        })
 
-        # ✅ FIX ROLE NAMES + PRESERVE ORDER
-        if chat_history:
-            for msg in chat_history:
-                role = msg["role"]
-                if role == "ai":
-                    role = "assistant"   # 🔥 CRITICAL FIX
+    # ✅ FIX ROLE NAMES + PRESERVE ORDER
+    if chat_history:
+        for msg in chat_history:
+            role = msg["role"]
+            if role == "ai":
+                role = "assistant"   # 🔥 CRITICAL FIX
 
-                messages.append({
-                    "role": role,
-                    "content": msg["text"]
-                })
-        else:
-            # Only add user message if no history exists
             messages.append({
-                "role": "user",
-                "content": user_message
+                "role": role,
+                "content": msg["text"]
             })
+    else:
+        # Only add user message if no history exists
+        messages.append({
+            "role": "user",
+            "content": user_message
+        })
+
+    return messages
+
 
-        completion = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=700,
-        )
+async def ai_fitness_chat(user_message, food_context=None, chat_history=None):
+    # a full chat queue is a 503, not an "unavailable" reply
+    async with chat_limit:
+        try:
+            completion = await client.chat.completions.create(
+                model="llama-3.1-8b-instant",
+                messages=build_messages(user_message, food_context, chat_history),
+                temperature=0.7,
+                max_tokens=700,
+            )
 
-        return {
-            "reply": completion.choices[0].message.content.strip()
-        }
+            return {
+                "reply": completion.choices[0].message.content.strip()
+            }
 
-    except Exception as e:
-        print("Groq error:", e)
-        return {
-            "reply": "⚠️ AI is temporarily unavailable"
-        }
+        except Exception as e:
+            print("Groq error:", e)
+            return {
+                "reply": "⚠️ AI is temporarily unavailable"
+            }
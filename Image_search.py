@@ -3,6 +3,8 @@ from dotenv import load_dotenv
 from google import genai
 from PIL import Image
 
+from work_limits import vision_limit
+
 load_dotenv()
 
 if not os.getenv("GOOGLE_API_KEY"):
@@ -24,14 +26,7 @@ Example output:
 rice, grilled chicken, boiled egg
 """
 
-def detect_foods_from_image(image_path: str) -> str:
-    image = Image.open(image_path)
-
-    response = llm.models.generate_content(
-        model="models/gemini-2.5-flash",
-        contents=[FOOD_DETECTION_PROMPT, image]
-    )
-
+def clean_detection(response) -> str:
     text = response.text.strip()
 
     # sanitize output
@@ -39,3 +34,15 @@ def detect_foods_from_image(image_path: str) -> str:
     text = text.replace(".", "").strip()
 
     return text
+
+
+async def detect_foods_from_image(image_path: str) -> str:
+    image = Image.open(image_path)
+
+    async with vision_limit:
+        response = await llm.aio.models.generate_content(
+            model="models/gemini-2.5-flash",
+            contents=[FOOD_DETECTION_PROMPT, image]
+        )
+
+    return clean_detection(response)
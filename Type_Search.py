@@ -1,7 +1,8 @@
 import os
+import copy
 import json
-import re
 import time
+import asyncio
 from dotenv import load_dotenv
 from fastapi import HTTPException
 
@@ -9,6 +10,26 @@ from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+from nutrition_cache import (
+    canonicalize_food_input,
+    split_food_items,
+    resolve_items,
+    resolve_item_lists,
+    aresolve_items,
+    meal_cache,
+    food_cache,
+    item_cache,
+    negative_cache,
+    remember_failure,
+    record_llm_call,
+)
+from single_flight import nutrition_flight, anutrition_flight
+from work_limits import nutrition_llm_limit
+from llm_batcher import MicroBatcher, LLM_MICROBATCH
+from nutrient_matrix import nutrient_totals, meal_totals, MICRONUTRIENTS
+from food_db import record_from_answer, micronutrients_for
+from quantity_parser import parse_quantity
+
 # ===================== ENV =====================
 load_dotenv()
 
@@ -19,7 +40,15 @@ if not GROQ_API_KEY:
 os.environ["GROQ_API_KEY"] = GROQ_API_KEY
 
 # ===================== CONSTANTS =====================
-MAX_FOODS = 10
+# Sanity cap only: long lists are split into chunks resolved in parallel
+# (FANOUT_CHUNK_SIZE / FANOUT_CONCURRENCY in nutrition_cache)
+MAX_FOODS = int(os.getenv("MAX_FOODS", "100"))
+
+# Batch endpoint: meals per request, and the output-token budget of one
+# packed prompt; each food answer costs roughly TOKENS_PER_FOOD
+BATCH_MAX_MEALS = int(os.getenv("BATCH_MAX_MEALS", "100"))
+BATCH_MAX_TOKENS = int(os.getenv("BATCH_MAX_TOKENS", "4000"))
+TOKENS_PER_FOOD = int(os.getenv("TOKENS_PER_FOOD", "70"))
 
 # ===================== UTILS =====================
 def normalize_food_name(name: str) -> str:
@@ -27,20 +56,7 @@ def normalize_food_name(name: str) -> str:
 
 
 def calculate_total_nutrition(foods: list) -> dict:
-    total = {
-        "carbohydrates_g": 0.0,
-        "protein_g": 0.0,
-        "fat_g": 0.0,
-        "calories_kcal": 0.0,
-    }
-
-    for food in foods:
-        total["carbohydrates_g"] += float(food.get("carbohydrates_g", 0))
-        total["protein_g"] += float(food.get("protein_g", 0))
-        total["fat_g"] += float(food.get("fat_g", 0))
-        total["calories_kcal"] += float(food.get("calories_kcal", 0))
-
-    return {k: round(v, 2) for k, v in total.items()}
+    return nutrient_totals(foods)
 
 
 # ===================== SAFE JSON PARSER =====================
@@ -68,44 +84,17 @@ llm = ChatGroq(
 
 parser = StrOutputParser()
 
-# ===================== PROMPT (CRITICAL FIX) =====================
-prompt = ChatPromptTemplate.from_messages(
+# ===================== PROMPT =====================
+# Only the items no local stage could answer get here: a short numbered
+# prompt, answered in item order so each answer maps back to its item
+items_prompt = ChatPromptTemplate.from_messages(
     [
         (
             "system",
-            f"""
-You are a professional nutrition assistant.
-
-CRITICAL:
-- Fix spelling mistakes
-- Use ONLY real foods
-- DO NOT hallucinate foods
-
-Rules:
-1. User may give multiple foods (MAX {MAX_FOODS})
-2. Use quantity if present, otherwise standard serving
-3. Return nutrition per food
-4. Return ONLY valid JSON
-
-The response MUST be a JSON object with this EXACT structure:
-
-{{{{ 
-  "foods": [
-    {{{{
-      "food_name": "string",
-      "quantity": "string",
-      "carbohydrates_g": number,
-      "protein_g": number,
-      "fat_g": number,
-      "calories_kcal": number
-    }}}}
-  ]
-}}}}
-
-DO NOT include any text outside JSON.
-"""
+            """Nutrition per numbered item. Fix spelling, real foods only. Use the given quantity, else a standard serving; weight_g = total grams. Answer every item once, in order.
+JSON only: {{"foods":[{{"food_name":"","quantity":"","weight_g":0,"carbohydrates_g":0,"protein_g":0,"fat_g":0,"calories_kcal":0}}]}}"""
         ),
-        ("human", "Food input: {food_input}")
+        ("human", "{items}")
     ]
 )
 
@@ -120,46 +109,283 @@ def invoke_with_retry(chain, payload, retries=3, delay=2):
             time.sleep(delay)
 
 
+async def ainvoke_with_retry(chain, payload, retries=3, delay=2):
+    for attempt in range(retries):
+        try:
+            return await chain.ainvoke(payload)
+        except Exception as e:
+            if attempt == retries - 1:
+                raise e
+            await asyncio.sleep(delay)
+
+
+# ===================== LLM CALL =====================
+def items_chain(items: list, max_tokens: int = None):
+    """(chain, payload) for a numbered list of items."""
+    model = llm.bind(max_tokens=max_tokens) if max_tokens else llm
+    numbered = "\n".join(f"{i}. {item}" for i, item in enumerate(items, 1))
+    return items_prompt | model | parser, {"items": numbered}
+
+
+def parse_foods(response: str) -> list:
+    foods = safe_json_parse(response).get("foods", [])
+
+    # Normalize names
+    for food in foods:
+        food["food_name"] = normalize_food_name(food.get("food_name", ""))
+
+    return foods
+
+
+def llm_unavailable(error: Exception) -> HTTPException:
+    print("❌ LLM ERROR:", repr(error))
+    return HTTPException(
+        status_code=503,
+        detail="Nutrition service temporarily unavailable"
+    )
+
+
+def query_llm_items(items: list, max_tokens: int = None) -> list:
+    chain, payload = items_chain(items, max_tokens)
+    record_llm_call()
+
+    try:
+        response = invoke_with_retry(chain, payload, retries=3, delay=2)
+    except Exception as e:
+        raise llm_unavailable(e)
+
+    return parse_foods(response)
+
+
+async def aquery_llm_items(items: list, max_tokens: int = None) -> list:
+    chain, payload = items_chain(items, max_tokens)
+    record_llm_call()
+
+    async with nutrition_llm_limit:
+        try:
+            response = await ainvoke_with_retry(chain, payload, retries=3, delay=2)
+        except Exception as e:
+            raise llm_unavailable(e)
+
+    return parse_foods(response)
+
+
+# Concurrent requests share prompts when LLM_MICROBATCH=1
+micro_batcher = MicroBatcher(
+    lambda items: query_llm_items(items, max_tokens=max(700, len(items) * TOKENS_PER_FOOD))
+)
+
+
 # ===================== CORE FUNCTION =====================
-def get_nutrition(food_input: str) -> dict:
+def lookup_nutrition(food_input: str):
+    """
+    (items, cache_key, cached result or None) for an input; raises for
+    oversized and known-bad inputs.
+    """
+    items = split_food_items(food_input)
+
     # ---- FOOD COUNT LIMIT ----
-    food_count = len([f for f in re.split(r",|and", food_input) if f.strip()])
-    if food_count > MAX_FOODS:
+    if len(items) > MAX_FOODS:
         raise HTTPException(
             status_code=400,
             detail=f"Maximum {MAX_FOODS} foods allowed"
         )
 
-    chain = prompt | llm | parser
+    # ---- CACHE LOOKUP ----
+    cache_key = canonicalize_food_input(food_input)
+    cached = meal_cache.get(cache_key)
+    if cached is not None:
+        return items, cache_key, served_from_cache(cached)
 
+    # ---- KNOWN-BAD INPUTS FAIL FAST ----
+    failure = negative_cache.get(cache_key)
+    if failure is not None:
+        raise HTTPException(**failure)
+
+    return items, cache_key, None
+
+
+def get_nutrition(food_input: str) -> dict:
+    items, cache_key, cached = lookup_nutrition(food_input)
+    if cached is not None:
+        return cached
+
+    # ---- CONCURRENT IDENTICAL REQUESTS SHARE ONE LOOKUP ----
+    return nutrition_flight.do(cache_key, resolve_nutrition, items, cache_key)
+
+
+async def aget_nutrition(food_input: str) -> dict:
+    """
+    get_nutrition() on the event loop: provider calls are awaited, and
+    cache reads and writes (SQLite) run in a worker thread.
+    """
+    items, cache_key, cached = await asyncio.to_thread(lookup_nutrition, food_input)
+    if cached is not None:
+        return cached
+
+    return await anutrition_flight.do(cache_key, aresolve_nutrition, items, cache_key)
+
+
+def resolve_nutrition(items: list, cache_key: str) -> dict:
     try:
-        response = invoke_with_retry(
-            chain,
-            {"food_input": food_input},
-            retries=3,
-            delay=2,
+        # ---- STAGED: CACHE → ALIAS → LOCAL DB → FUZZY, LLM FOR LEFTOVERS ----
+        foods = resolve_items(
+            items,
+            micro_batcher.fetch if LLM_MICROBATCH else query_llm_items,
         )
-        data = safe_json_parse(response)
-    except HTTPException:
+        if not foods:
+            raise HTTPException(status_code=500, detail="No food detected")
+    except HTTPException as e:
+        remember_failure(cache_key, e)
         raise
-    except Exception as e:
-        print("❌ LLM ERROR:", repr(e))
-        raise HTTPException(
-            status_code=503,
-            detail="Nutrition service temporarily unavailable"
+
+    result = build_result(foods)
+    meal_cache.set(cache_key, result)
+    return result
+
+
+async def aresolve_nutrition(items: list, cache_key: str) -> dict:
+    async def fetch_batched(missing: list) -> list:
+        # awaiting the batch's future holds no thread while it fills and runs
+        async with nutrition_llm_limit:
+            return await asyncio.wrap_future(micro_batcher.submit(missing))
+
+    try:
+        foods = await aresolve_items(
+            items,
+            fetch_batched if LLM_MICROBATCH else aquery_llm_items,
         )
+        if not foods:
+            raise HTTPException(status_code=500, detail="No food detected")
+    except HTTPException as e:
+        await asyncio.to_thread(remember_failure, cache_key, e)
+        raise
 
-    foods = data.get("foods", [])
-    if not foods:
-        raise HTTPException(status_code=500, detail="No food detected")
+    result = build_result(foods)
+    await asyncio.to_thread(meal_cache.set, cache_key, result)
+    return result
 
-    # Normalize names
-    for food in foods:
-        food["food_name"] = normalize_food_name(food.get("food_name", ""))
 
+def build_result(foods: list, totals: dict = None) -> dict:
     return {
         "result_type": "multiple" if len(foods) > 1 else "single",
         "serving_note": "Nutrition calculated based on provided quantity or standard serving",
         "foods": foods,
-        "total_nutrition": calculate_total_nutrition(foods),
+        "total_nutrition": totals if totals is not None else calculate_total_nutrition(foods),
     }
+
+
+def served_from_cache(result: dict) -> dict:
+    """A meal-cache hit: foods say so, and keep how they were first resolved."""
+    for food in result["foods"]:
+        food["resolved_by"] = food.get("source")
+        food["source"] = "cache"
+    return result
+
+
+def add_micronutrients(result: dict) -> dict:
+    """
+    Opt-in micronutrients, computed locally: per food (None when the LLM
+    resolved it) and totals over the foods that have them (None for a
+    nutrient no food has data for). Returns a copy; the result may be
+    shared with the cache and other requests.
+    """
+    result = copy.deepcopy(result)
+    values = micronutrients_for(result["foods"])
+    for food, micronutrients in zip(result["foods"], values):
+        food["micronutrients"] = micronutrients
+    available = [v for v in values if v is not None]
+    totals = nutrient_totals(available, MICRONUTRIENTS)
+    result["total_micronutrients"] = {
+        n: totals[n] if any(v[n] is not None for v in available) else None
+        for n in MICRONUTRIENTS
+    }
+    result["micronutrients_unavailable"] = [
+        food.get("food_name") for food, v in zip(result["foods"], values) if v is None
+    ]
+    return result
+
+
+# ===================== BATCH =====================
+def get_nutrition_batch(meals: list) -> list:
+    """
+    One result per meal, in input order. Repeated meals and cached meals
+    cost nothing; the unknown items of all other meals are deduplicated
+    and packed into as few prompts as BATCH_MAX_TOKENS allows. A meal that
+    fails gets {"error": {"status_code", "detail"}} instead of a result.
+    """
+    results = [None] * len(meals)
+    pending = {}
+    for index, meal in enumerate(meals):
+        items = split_food_items(meal)
+        cache_key = canonicalize_food_input(meal)
+        if cache_key in pending:
+            pending[cache_key][1].append(index)
+            continue
+        if not items:
+            results[index] = {"error": {"status_code": 400, "detail": "Food input cannot be empty"}}
+            continue
+        if len(items) > MAX_FOODS:
+            results[index] = {"error": {"status_code": 400, "detail": f"Maximum {MAX_FOODS} foods allowed"}}
+            continue
+        cached = meal_cache.get(cache_key)
+        if cached is not None:
+            results[index] = served_from_cache(cached)
+            continue
+        failure = negative_cache.get(cache_key)
+        if failure is not None:
+            results[index] = {"error": failure}
+            continue
+        pending[cache_key] = (items, [index])
+
+    chunk_size = max(1, BATCH_MAX_TOKENS // TOKENS_PER_FOOD)
+    resolved = resolve_item_lists(
+        [items for items, _ in pending.values()],
+        lambda missing: query_llm_items(missing, max_tokens=BATCH_MAX_TOKENS),
+        chunk_size,
+    )
+    # totals of every resolved meal in one grouped sum
+    totals = meal_totals([foods if isinstance(foods, list) else [] for foods in resolved])
+
+    for (cache_key, (items, indexes)), foods, meal_total in zip(pending.items(), resolved, totals):
+        try:
+            if isinstance(foods, Exception):
+                raise foods
+            if not foods:
+                raise HTTPException(status_code=500, detail="No food detected")
+            else:
+                result = build_result(foods, meal_total)
+                meal_cache.set(cache_key, result)
+        except HTTPException as e:
+            remember_failure(cache_key, e)
+            result = {"error": {"status_code": e.status_code, "detail": e.detail}}
+        for index in indexes:
+            results[index] = copy.deepcopy(result)
+
+    return results
+
+
+# ===================== STALE-WHILE-REVALIDATE =====================
+# Expired cache entries are re-queried in the background with these
+def refresh_meal(cache_key: str):
+    # same staged path as a request: local items stay local, long meals chunk
+    foods = resolve_items(split_food_items(cache_key), query_llm_items)
+    return build_result(foods) if foods else None
+
+
+def refresh_food(name: str):
+    foods = query_llm_items([name])
+    return record_from_answer(parse_quantity(name), foods[0]) if len(foods) == 1 else None
+
+
+def refresh_item(item_key: str):
+    foods = query_llm_items([item_key])
+    if len(foods) != 1:
+        return None
+    foods[0].pop("weight_g", None)
+    return foods[0]
+
+
+meal_cache.refresher = refresh_meal
+food_cache.refresher = refresh_food
+item_cache.refresher = refresh_item
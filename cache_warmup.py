@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+
+from nutrition_cache import canonicalize_item, split_food_items, lookup_item, resolve_items, store
+from Type_Search import query_llm_items
+
+# ===================== CONFIG =====================
+WARMUP_LOG = os.getenv("WARMUP_LOG", "")
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "200"))
+# LLM calls per second, low enough to leave the Groq quota to live traffic
+WARMUP_RATE = float(os.getenv("WARMUP_RATE", "0.5"))
+WARMUP_BATCH = int(os.getenv("WARMUP_BATCH", "5"))
+# /ready reports 503 until the warm-up has finished
+WARMUP_REQUIRED_FOR_READY = os.getenv("WARMUP_REQUIRED_FOR_READY", "0") == "1"
+
+# Append every searched food to this JSONL file ("" disables it)
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "")
+
+QUERY_FIELDS = ("food_name", "food_input", "query", "transcript", "detected_foods")
+
+
+# ===================== QUERY LOG =====================
+_log_lock = threading.Lock()
+
+
+def record_query(food_input: str, endpoint: str) -> None:
+    if not QUERY_LOG_PATH:
+        return
+    line = json.dumps({"ts": round(time.time()), "endpoint": endpoint, "food_input": food_input})
+    try:
+        with _log_lock, open(QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print("⚠️ QUERY LOG ERROR:", repr(e))
+
+
+def read_queries(path: str) -> list:
+    """Food strings from a JSONL log; plain-text lines are taken as-is."""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                queries.append(line)
+                continue
+            if isinstance(record, str):
+                queries.append(record)
+            elif isinstance(record, dict):
+                for field in QUERY_FIELDS:
+                    if isinstance(record.get(field), str):
+                        queries.append(record[field])
+                        break
+    return queries
+
+
+def top_items(queries: list, top_n: int = WARMUP_TOP_N) -> list:
+    counts = Counter(
+        canonicalize_item(item)
+        for query in queries
+        for item in split_food_items(query)
+    )
+    counts.pop("", None)
+    return [item for item, _ in counts.most_common(top_n)]
+
+
+# ===================== WARM-UP =====================
+class CacheWarmup:
+    """
+    Pre-resolves the most frequent items through resolve_items, a few
+    items per call, at `rate` calls per second. Only the item and food
+    tiers are filled, never meal keys for the made-up chunks. Only one
+    worker on the node runs it; the others see status "skipped" and
+    aren't ready until it's done.
+    """
+
+    LEASE_SECONDS = 3600
+
+    def __init__(self):
+        self.status = "idle"
+        self.total = 0
+        self.warmed = 0
+        self.failed = 0
+        self.skipped_cached = 0
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def run(self, path: str, top_n: int = WARMUP_TOP_N, rate: float = WARMUP_RATE,
+            batch: int = WARMUP_BATCH) -> None:
+        self.status = "running"
+        self.started_at = time.time()
+        leased = False
+        try:
+            if store is not None:
+                leased = store.claim("lease", "warmup", self.LEASE_SECONDS)
+                if not leased:
+                    self.status = "skipped"
+                    return
+
+            items = top_items(read_queries(path), top_n)
+            pending = []
+            for item in items:
+                if lookup_item(item) is None:
+                    pending.append(item)
+                else:
+                    self.skipped_cached += 1
+            self.total = len(pending)
+
+            for start in range(0, len(pending), batch):
+                chunk = pending[start:start + batch]
+                try:
+                    resolve_items(chunk, query_llm_items, chunk_size=batch)
+                    self.warmed += len(chunk)
+                except Exception as e:
+                    print("⚠️ WARMUP ERROR:", repr(e))
+                    self.failed += len(chunk)
+                if rate > 0:
+                    time.sleep(1 / rate)
+
+            self.status = "done"
+        except Exception as e:
+            print("❌ WARMUP FAILED:", repr(e))
+            self.status = "failed"
+        finally:
+            if leased:
+                store.delete("lease", "warmup")
+            self.finished_at = time.time()
+            self._done.set()
+
+    def start(self, path: str, **kwargs) -> None:
+        # not ready from the moment it's scheduled
+        self.status = "running"
+        threading.Thread(target=self.run, args=(path,), kwargs=kwargs, daemon=True).start()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    @property
+    def ready(self) -> bool:
+        if self.status == "skipped":
+            # not ready until the worker holding the lease has finished
+            return not self.lease_held()
+        return self.status in ("idle", "done", "failed")
+
+    @staticmethod
+    def lease_held() -> bool:
+        row = store.get("lease", "warmup") if store is not None else None
+        return row is not None and row[1] > time.time()
+
+    def report(self) -> dict:
+        return {
+            "status": self.status,
+            "total": self.total,
+            "warmed": self.warmed,
+            "failed": self.failed,
+            "already_cached": self.skipped_cached,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+warmup = CacheWarmup()
+
+
+# ===================== CLI =====================
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Pre-fill the nutrition cache from a query log")
+    arg_parser.add_argument("log", help="JSONL query log, e.g. the file written via QUERY_LOG_PATH")
+    arg_parser.add_argument("--top", type=int, default=WARMUP_TOP_N)
+    arg_parser.add_argument("--rate", type=float, default=WARMUP_RATE, help="LLM calls per second")
+    arg_parser.add_argument("--batch", type=int, default=WARMUP_BATCH, help="items per LLM call")
+    args = arg_parser.parse_args(argv)
+
+    warmup.run(args.log, top_n=args.top, rate=args.rate, batch=args.batch)
+    print(json.dumps(warmup.report(), indent=2))
+    return 0 if warmup.status in ("done", "skipped") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
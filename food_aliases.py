@@ -0,0 +1,92 @@
+import os
+import re
+import csv
+import threading
+
+from food_db import FOODS, FOODS_MAPPED, find_record
+
+# ===================== CONFIG =====================
+# alias,food rows: regional names, transliterations and English
+# equivalents, each pointing at one canonical food name
+FOOD_ALIASES_PATH = os.getenv(
+    "FOOD_ALIASES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "food_aliases.csv"),
+)
+
+
+# ===================== TRANSLITERATION =====================
+def fold_spelling(name: str) -> str:
+    """
+    Collapses common romanization differences so variants share a key:
+    "chapathi"/"chapati", "phulka"/"fulka", "daal"/"dhal"/"dal",
+    "poori"/"puri", "idly"/"idli", "wada"/"vada".
+    """
+    text = name.lower().replace("ph", "f").replace("chh", "ch")
+    text = re.sub(r"([bdtkgj])h", r"\1", text)
+    text = text.replace("w", "v").replace("ee", "i").replace("oo", "u")
+    text = re.sub(r"(.)\1+", r"\1", text)
+    return re.sub(r"y\b", "i", text)
+
+
+# ===================== LOAD =====================
+def load_aliases(path: str = FOOD_ALIASES_PATH) -> dict:
+    aliases = {}
+    if not path or not os.path.exists(path):
+        print("⚠️ FOOD ALIASES NOT FOUND:", path)
+        return aliases
+
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            alias = " ".join(row["alias"].lower().split())
+            food = " ".join(row["food"].lower().split())
+            if alias and food and alias != food:
+                aliases[alias] = food
+    return aliases
+
+
+def build_folded(aliases: dict, foods) -> dict:
+    """Folded spelling -> canonical food; spellings two foods share are dropped."""
+    folded = {}
+    for name, food in [(food, food) for food in foods] + list(aliases.items()):
+        key = fold_spelling(name)
+        if folded.get(key, food) != food:
+            folded[key] = None
+        else:
+            folded[key] = food
+    return {key: food for key, food in folded.items() if food is not None}
+
+
+def fold_table() -> None:
+    global FOLDED_NAMES
+    FOLDED_NAMES = build_folded(FOOD_ALIASES, list(FOODS) + list(FOOD_ALIASES.values()))
+
+
+FOOD_ALIASES = load_aliases()
+if FOODS_MAPPED:
+    # aliases fold right away, the binary table's names in the background
+    FOLDED_NAMES = build_folded(FOOD_ALIASES, list(FOOD_ALIASES.values()))
+    threading.Thread(target=fold_table, daemon=True).start()
+else:
+    fold_table()
+
+
+# ===================== LOOKUP =====================
+def alias_for(name: str):
+    """Canonical food for a known alias or spelling variant, else None."""
+    if name in FOODS:
+        return None
+    food = find_record(name, FOOD_ALIASES)
+    if food is None:
+        food = find_record(fold_spelling(name), FOLDED_NAMES)
+    return food if food != name else None
+
+
+def canonical_food(name: str) -> str:
+    return alias_for(name) or name
+
+
+def aliases_by_food() -> dict:
+    grouped = {}
+    for alias, food in FOOD_ALIASES.items():
+        grouped.setdefault(food, []).append(alias)
+    return grouped
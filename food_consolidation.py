@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from food_db import FOODS, NUTRIENTS, LLM_SAMPLE_LOG, add_food, reload_learned
+from food_suggest import suggest_index
+from nutrition_cache import store
+
+# ===================== CONFIG =====================
+# Consistent samples a food needs before it is promoted to the local table
+CONSOLIDATE_MIN_SAMPLES = int(os.getenv("CONSOLIDATE_MIN_SAMPLES", "5"))
+# A sample is consistent when every nutrient is within this fraction of the
+# median (or CONSOLIDATE_MIN_ABS for near-zero values like fat in tea)
+CONSOLIDATE_TOLERANCE = float(os.getenv("CONSOLIDATE_TOLERANCE", "0.15"))
+CONSOLIDATE_MIN_ABS = float(os.getenv("CONSOLIDATE_MIN_ABS", "1.0"))
+# Seconds between background runs in the API process
+CONSOLIDATE_INTERVAL = float(os.getenv("CONSOLIDATE_INTERVAL", "3600"))
+# Seconds between checks for foods promoted by other workers or the CLI
+CONSOLIDATE_SYNC_INTERVAL = float(os.getenv("CONSOLIDATE_SYNC_INTERVAL", "60"))
+
+
+# ===================== SAMPLES =====================
+def read_samples(path: str) -> dict:
+    """{food name: [sample records]} from the JSONL sample log."""
+    samples = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                samples[record["name"]].append(record)
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+    return samples
+
+
+def consensus(samples: list, tolerance: float = CONSOLIDATE_TOLERANCE):
+    """
+    (record, consistent sample count): the median per-100 g values after
+    dropping samples that stray from the median on any nutrient, and the
+    median serving of the samples that stated one.
+    """
+    values = np.array(
+        [[float(s["per_100g"].get(n, 0)) for n in NUTRIENTS] for s in samples],
+        dtype=np.float64,
+    )
+    median = np.median(values, axis=0)
+    allowed = np.maximum(np.abs(median) * tolerance, CONSOLIDATE_MIN_ABS)
+    inliers = np.all(np.abs(values - median) <= allowed, axis=1)
+    if not inliers.any():
+        return None, 0
+
+    per_100g = np.median(values[inliers], axis=0)
+
+    kept = [s for s, keep in zip(samples, inliers) if keep and s.get("serving_g")]
+    serving_g, serving_unit = None, None
+    if kept:
+        serving_unit = Counter(s["serving_unit"] for s in kept).most_common(1)[0][0]
+        serving_g = float(np.median([s["serving_g"] for s in kept if s["serving_unit"] == serving_unit]))
+
+    record = {
+        "name": samples[0]["name"],
+        "category": "learned",
+        "per_100g": {n: round(float(v), 3) for n, v in zip(NUTRIENTS, per_100g)},
+        "serving_g": serving_g,
+        "serving_unit": serving_unit,
+    }
+    return record, int(inliers.sum())
+
+
+# ===================== CONSOLIDATION =====================
+class FoodConsolidation:
+    """
+    Promotes foods whose logged LLM answers agree into the local table.
+    Each run reads the sample log, takes a robust consensus per food and
+    appends foods with at least `min_samples` consistent samples (and a
+    known serving) to the learned table, after which they resolve
+    locally. Only one worker on the node runs it at a time; every worker
+    reloads the learned table when it changes.
+    """
+
+    LEASE_SECONDS = 600
+
+    def __init__(self):
+        self.status = "idle"
+        self.runs = 0
+        self.promoted = []
+        self.pending = 0
+        self.last_run_at = None
+        self._stop = threading.Event()
+
+    def run(self, path: str = LLM_SAMPLE_LOG, min_samples: int = CONSOLIDATE_MIN_SAMPLES,
+            dry_run: bool = False) -> list:
+        self.status = "running"
+        leased = False
+        promoted = []
+        try:
+            if store is not None and not dry_run:
+                leased = store.claim("lease", "consolidation", self.LEASE_SECONDS)
+                if not leased:
+                    self.status = "skipped"
+                    return promoted
+
+            # names promoted elsewhere are in FOODS after this
+            self.sync()
+            pending = 0
+            for name, samples in read_samples(path).items():
+                if name in FOODS or len(samples) < min_samples:
+                    continue
+                record, consistent = consensus(samples)
+                if record is None or consistent < min_samples or record["serving_g"] is None:
+                    pending += 1
+                    continue
+                promoted.append(record)
+                if not dry_run:
+                    self.promote(record)
+
+            self.pending = pending
+            if not dry_run:
+                self.promoted.extend(r["name"] for r in promoted)
+            self.status = "done"
+        except Exception as e:
+            print("❌ CONSOLIDATION FAILED:", repr(e))
+            self.status = "failed"
+        finally:
+            if leased:
+                store.delete("lease", "consolidation")
+            self.runs += 1
+            self.last_run_at = time.time()
+        return promoted
+
+    def promote(self, record: dict) -> None:
+        # the shared food_cache row stays: workers that haven't reloaded
+        # the learned table yet still answer from it
+        add_food(record)
+        suggest_index.add(record["name"], source="local")
+        print("✅ PROMOTED:", record["name"])
+
+    def sync(self) -> list:
+        added = reload_learned()
+        for record in added:
+            suggest_index.add(record["name"], source="local")
+        return added
+
+    def start(self, path: str = LLM_SAMPLE_LOG, interval: float = CONSOLIDATE_INTERVAL,
+              sync_interval: float = CONSOLIDATE_SYNC_INTERVAL) -> None:
+        def loop():
+            next_run = time.monotonic() + interval
+            while not self._stop.wait(min(interval, sync_interval)):
+                self.sync()
+                if path and os.path.exists(path) and time.monotonic() >= next_run:
+                    next_run = time.monotonic() + interval
+                    self.run(path)
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def report(self) -> dict:
+        return {
+            "status": self.status,
+            "runs": self.runs,
+            "promoted": self.promoted[-50:],
+            "pending": self.pending,
+            "last_run_at": self.last_run_at,
+        }
+
+
+consolidation = FoodConsolidation()
+
+
+# ===================== CLI =====================
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Promote consistent LLM answers into the local food table")
+    arg_parser.add_argument("log", nargs="?", default=LLM_SAMPLE_LOG, help="JSONL sample log (LLM_SAMPLE_LOG)")
+    arg_parser.add_argument("--min-samples", type=int, default=CONSOLIDATE_MIN_SAMPLES)
+    arg_parser.add_argument("--dry-run", action="store_true", help="print the consensus, promote nothing")
+    args = arg_parser.parse_args(argv)
+
+    if not args.log or not os.path.exists(args.log):
+        print("❌ SAMPLE LOG NOT FOUND:", args.log)
+        return 1
+
+    promoted = consolidation.run(args.log, min_samples=args.min_samples, dry_run=args.dry_run)
+    print(json.dumps({**consolidation.report(), "records": promoted}, indent=2))
+    return 0 if consolidation.status in ("done", "skipped") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
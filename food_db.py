@@ -0,0 +1,302 @@
+import os
+import re
+import csv
+import json
+import time
+import threading
+from collections import ChainMap
+
+import numpy as np
+
+from quantity_parser import parse_quantity, to_grams, UNIT_GRAMS, COUNT_UNITS
+from nutrient_matrix import NutrientMatrix, LayeredNutrientMatrix, NUTRIENTS, MICRONUTRIENTS
+from food_db_mmap import MmapFoodDB
+
+# ===================== CONFIG =====================
+# CSV with per-100 g macros and a standard serving per food; point this at
+# a larger table in the same format to cover more foods
+FOOD_DB_PATH = os.getenv(
+    "FOOD_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "foods.csv"),
+)
+
+# Same table compiled by food_db_mmap.py; used instead of the CSV when set,
+# so large tables load instantly and share pages across workers
+FOOD_DB_BINARY = os.getenv("FOOD_DB_BINARY", "")
+
+# Foods promoted from consistent LLM answers, same format; loaded after the
+# main table, which wins on conflicts
+LEARNED_FOODS_PATH = os.getenv(
+    "LEARNED_FOODS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "learned_foods.csv"),
+)
+
+# Append every per-100 g record learned from the LLM to this JSONL file,
+# the input of food_consolidation ("" disables it)
+LLM_SAMPLE_LOG = os.getenv("LLM_SAMPLE_LOG", "")
+
+FOOD_FIELDS = ("name", "category") + NUTRIENTS + ("serving_g", "serving_unit")
+
+# grams stated inside an LLM quantity string: "1 bowl (200 g)", "150ml"
+GRAMS_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:g|gm|gms|grams?|ml)\b")
+
+
+# ===================== LOAD =====================
+def load_foods(path: str = FOOD_DB_PATH) -> dict:
+    """
+    {canonical name: {"name", "category", "per_100g": {...}, "serving_g", "serving_unit"}}
+    per_100g holds the macros plus whichever micronutrient columns the row fills.
+    """
+    foods = {}
+    if not path or not os.path.exists(path):
+        print("⚠️ FOOD DB NOT FOUND:", path)
+        return foods
+
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            name = " ".join(row["name"].lower().split())
+            foods[name] = {
+                "name": name,
+                "category": row.get("category", ""),
+                "per_100g": {
+                    **{n: float(row[n]) for n in NUTRIENTS},
+                    **{n: float(row[n]) for n in MICRONUTRIENTS if row.get(n)},
+                },
+                "serving_g": float(row["serving_g"]),
+                "serving_unit": row["serving_unit"],
+            }
+    return foods
+
+
+def load_table():
+    """
+    (FOODS, FOOD_MATRIX): the main table with learned foods layered under
+    it, and the same values as a foods x nutrients array for batch scaling
+    and totals.
+    """
+    learned = load_foods(LEARNED_FOODS_PATH) if os.path.exists(LEARNED_FOODS_PATH) else {}
+
+    if FOOD_DB_BINARY and os.path.exists(FOOD_DB_BINARY):
+        table = MmapFoodDB(FOOD_DB_BINARY)
+        # records are read from the mapped file on demand; promoted foods
+        # are written to the dict in front of it. The matrix uses the
+        # mapped float32 table in place and looks rows up in its index.
+        foods = ChainMap({name: r for name, r in learned.items() if name not in table}, table)
+        matrix = LayeredNutrientMatrix(table.nutrient_values(), table.row, table.columns)
+        if not set(MICRONUTRIENTS) <= set(table.columns):
+            print("⚠️ FOOD DB BINARY HAS NO MICRONUTRIENT COLUMNS:", FOOD_DB_BINARY)
+        for name, record in foods.maps[0].items():
+            matrix.add(name, record["per_100g"])
+        return foods, matrix
+
+    foods = {**learned, **load_foods()}
+    return foods, NutrientMatrix.from_records(foods, NUTRIENTS + MICRONUTRIENTS)
+
+
+def learned_stamp(path: str = LEARNED_FOODS_PATH):
+    """(mtime, size) of the learned table, None while it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+FOODS, FOOD_MATRIX = load_table()
+# True when FOODS reads from the mmap'd binary table; indexes over every
+# name of such a (large) table are built off the import path
+FOODS_MAPPED = isinstance(FOODS, ChainMap)
+# learned table as last loaded by this process
+_learned_stamp = learned_stamp()
+
+
+_write_lock = threading.Lock()
+
+
+def add_food(record: dict, path: str = LEARNED_FOODS_PATH) -> None:
+    """Appends a record to the learned table and makes it live in this process."""
+    row = {
+        "name": record["name"],
+        "category": record.get("category", "learned"),
+        **{n: round(record["per_100g"][n], 2) for n in NUTRIENTS},
+        "serving_g": round(record["serving_g"], 1),
+        "serving_unit": record["serving_unit"],
+    }
+    with _write_lock:
+        new_file = not os.path.exists(path)
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=FOOD_FIELDS)
+            if new_file:
+                writer.writeheader()
+            writer.writerow(row)
+        FOODS[record["name"]] = record
+        FOOD_MATRIX.add(record["name"], record["per_100g"])
+        global _learned_stamp
+        _learned_stamp = learned_stamp(path)
+
+
+def reload_learned(path: str = LEARNED_FOODS_PATH) -> list:
+    """
+    Makes foods that another worker (or the consolidation CLI) appended to
+    the learned table live in this process; returns their records. Only
+    re-reads the file when it changed.
+    """
+    global _learned_stamp
+    stamp = learned_stamp(path)
+    if stamp is None or stamp == _learned_stamp:
+        return []
+
+    with _write_lock:
+        _learned_stamp = stamp
+        added = [record for name, record in load_foods(path).items() if name not in FOODS]
+        for record in added:
+            FOODS[record["name"]] = record
+            FOOD_MATRIX.add(record["name"], record["per_100g"])
+    return added
+
+
+def log_sample(record: dict) -> None:
+    if not LLM_SAMPLE_LOG:
+        return
+    line = json.dumps({"ts": round(time.time()), **record})
+    try:
+        with _write_lock, open(LLM_SAMPLE_LOG, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print("⚠️ SAMPLE LOG ERROR:", repr(e))
+
+
+# ===================== LOOKUP =====================
+def find_food(name: str):
+    return find_record(name, FOODS)
+
+
+def scale_nutrients(per_100g: dict, grams: float) -> dict:
+    return {n: round(per_100g[n] * grams / 100, 1) for n in NUTRIENTS}
+
+
+def find_record(name: str, records: dict):
+    record = records.get(name)
+    if record is None and name.endswith("s"):
+        # "eggs", "rotis", "idlis"
+        record = records.get(name[:-1])
+    return record
+
+
+def describe_quantity(parsed: dict, record: dict, grams: float) -> str:
+    """Human-readable quantity: "2 piece (80 g)" or "200 g"."""
+    unit = parsed["unit"] or record["serving_unit"]
+    if unit == "g":
+        return f"{grams:g} g"
+    return f"{parsed['amount']:g} {unit} ({grams:g} g)"
+
+
+def food_from_db(item_key: str):
+    """
+    Nutrition for a canonical item ("200 g rice", "2 roti", "dal") from the
+    local table, scaled from per-100 g values to the parsed weight, in the
+    same shape as an LLM answer. None if the food isn't known.
+    """
+    # whole text first, so names with numbers ("chicken 65") stay intact
+    record = find_food(item_key)
+    parsed = {"food": item_key, "amount": 1.0, "unit": None}
+    if record is None:
+        parsed = parse_quantity(item_key)
+        record = find_food(parsed["food"])
+    if record is None:
+        return None
+    return food_from_record(parsed, record)
+
+
+def food_from_record(parsed: dict, record: dict):
+    """Scales a per-100 g record to a parsed quantity; None if its weight is unknown."""
+    grams = to_grams(parsed, record["serving_g"], record["serving_unit"])
+    if grams is None:
+        return None
+    return {
+        "food_name": record["name"].title(),
+        "quantity": describe_quantity(parsed, record, grams),
+        **scale_nutrients(record["per_100g"], grams),
+    }
+
+
+# ===================== LLM ANSWERS =====================
+def answer_grams(parsed: dict, answer: dict):
+    """Total weight behind an LLM answer, or None if it can't be told."""
+    try:
+        grams = float(answer.get("weight_g") or 0)
+    except (TypeError, ValueError):
+        grams = 0
+    if grams <= 0:
+        match = GRAMS_RE.search(str(answer.get("quantity", "")).lower())
+        grams = float(match.group(1)) if match else 0
+    if grams <= 0 and parsed["unit"] in UNIT_GRAMS:
+        grams = parsed["amount"] * UNIT_GRAMS[parsed["unit"]]
+    return grams if grams > 0 else None
+
+
+def record_from_answer(parsed: dict, answer: dict):
+    """
+    Per-100 g record, shaped like a FOODS row, from the LLM's answer for one
+    parsed item. Any other amount of the food can then be scaled locally.
+    None when the answer's weight can't be worked out, or when the item
+    asked for none of the food ("0 idli").
+    """
+    if parsed["amount"] <= 0:
+        return None
+    grams = answer_grams(parsed, answer)
+    if grams is None:
+        return None
+
+    try:
+        per_100g = {n: round(float(answer.get(n, 0)) * 100 / grams, 3) for n in NUTRIENTS}
+    except (TypeError, ValueError):
+        return None
+
+    # a plain count or a named unit tells us the serving; a weight doesn't
+    serving_g, serving_unit = None, None
+    if parsed["unit"] is None or parsed["unit"] in COUNT_UNITS:
+        serving_g, serving_unit = grams / parsed["amount"], "serving"
+    elif parsed["unit"] not in ("g", "kg", "ml", "l"):
+        serving_g, serving_unit = grams / parsed["amount"], parsed["unit"]
+
+    return {
+        "name": " ".join(str(answer.get("food_name") or parsed["food"]).lower().split()),
+        "category": "learned",
+        "per_100g": per_100g,
+        "serving_g": serving_g,
+        "serving_unit": serving_unit,
+    }
+
+
+def micronutrients_for(foods: list) -> list:
+    """
+    Micronutrients for response foods that came from the local table,
+    scaled to their weight in one vectorized pass over FOOD_MATRIX. None
+    for foods only the LLM could resolve; a value is None when the table
+    has no data for it.
+    """
+    columns = [FOOD_MATRIX.columns.index(n) if n in FOOD_MATRIX.columns else None for n in MICRONUTRIENTS]
+    known = []
+    for position, food in enumerate(foods):
+        name = " ".join(str(food.get("food_name", "")).lower().split())
+        # fuzzy hits on misspelt local foods are scaled from the same rows
+        source = food.get("resolved_by", food.get("source"))
+        row = FOOD_MATRIX.row_id(name) if source in ("local", "fuzzy") else None
+        if row is None:
+            continue
+        match = GRAMS_RE.search(str(food.get("quantity", "")).lower())
+        if match:
+            known.append((position, row, float(match.group(1))))
+
+    results = [None] * len(foods)
+    if not known:
+        return results
+
+    rows = FOOD_MATRIX.scale([row for _, row, _ in known], [grams for _, _, grams in known])
+    for (position, _, _), values in zip(known, rows):
+        results[position] = {
+            n: None if column is None or np.isnan(values[column]) else round(float(values[column]), 2)
+            for n, column in zip(MICRONUTRIENTS, columns)
+        }
+    return results
@@ -0,0 +1,181 @@
+import os
+import sys
+import csv
+import mmap
+import json
+import struct
+import argparse
+from collections.abc import Mapping
+
+import numpy as np
+
+from nutrient_matrix import NUTRIENTS, MICRONUTRIENTS
+
+# ===================== FORMAT =====================
+# [header][column names][float32 table][name index][strings]
+#
+# header   magic, version, columns, foods, then byte lengths/offsets
+# columns  comma-separated nutrient names, padded to 4 bytes
+# table    foods x (columns + 1) float32, per-100 g values then serving_g
+#          (NaN for unknown values and foods with no standard serving)
+# index    one entry per food sorted by UTF-8 name: string offset, name
+#          length, serving unit length, category length, table row
+# strings  name + serving unit + category per food, back to back
+MAGIC = b"FDBM"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIIII")
+ENTRY = struct.Struct("<IHBBI")
+
+
+# ===================== BUILDER =====================
+def build(csv_path: str, out_path: str, columns: tuple = NUTRIENTS + MICRONUTRIENTS) -> int:
+    """Compiles a foods CSV into the binary format; returns the food count."""
+    rows = {}
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            name = " ".join(row["name"].lower().split())
+            if name:
+                rows[name.encode("utf-8")] = row
+
+    names = sorted(rows)
+    table = np.full((len(names), len(columns) + 1), np.nan, dtype=np.float32)
+    strings = bytearray()
+    index = bytearray()
+    for position, name in enumerate(names):
+        row = rows[name]
+        # a column the CSV lacks or leaves empty stays NaN (unknown, not zero)
+        table[position, :-1] = [float(row[c]) if row.get(c) else np.nan for c in columns]
+        if row.get("serving_g"):
+            table[position, -1] = float(row["serving_g"])
+        unit = (row.get("serving_unit") or "").encode("utf-8")
+        category = (row.get("category") or "").encode("utf-8")
+        index += ENTRY.pack(len(strings), len(name), len(unit), len(category), position)
+        strings += name + unit + category
+
+    column_blob = ",".join(columns).encode("utf-8")
+    column_blob += b"\0" * (-len(column_blob) % 4)
+    table_offset = HEADER.size + len(column_blob)
+    index_offset = table_offset + table.nbytes
+    strings_offset = index_offset + len(index)
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(
+            MAGIC, VERSION, len(columns), len(names),
+            len(column_blob), table_offset, index_offset, strings_offset,
+        ))
+        f.write(column_blob)
+        f.write(table.tobytes())
+        f.write(index)
+        f.write(strings)
+    # workers that already mapped the old file keep their pages
+    os.replace(tmp_path, out_path)
+    return len(names)
+
+
+# ===================== READER =====================
+class MmapFoodDB(Mapping):
+    """
+    Read-only food table over an mmap'd file, with the same
+    {name: record} interface as food_db.FOODS. Lookups binary-search the
+    sorted index in place; a record dict is only built for a hit. The OS
+    shares the mapped pages between every worker on the node.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, n_columns, self.n_foods, columns_len,
+         table_offset, self._index_offset, self._strings_offset) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a food DB file (v{VERSION}): {path}")
+
+        blob = self._mm[HEADER.size:HEADER.size + columns_len].rstrip(b"\0")
+        self.columns = tuple(blob.decode("utf-8").split(","))
+        # zero-copy view of the float32 table
+        self.table = np.frombuffer(
+            self._mm, dtype=np.float32,
+            count=self.n_foods * (n_columns + 1), offset=table_offset,
+        ).reshape(self.n_foods, n_columns + 1)
+
+    # ---- INDEX ----
+    def _entry(self, position: int):
+        return ENTRY.unpack_from(self._mm, self._index_offset + position * ENTRY.size)
+
+    def _name_bytes(self, entry) -> bytes:
+        start = self._strings_offset + entry[0]
+        return self._mm[start:start + entry[1]]
+
+    def _find(self, name: str):
+        key = name.encode("utf-8")
+        lo, hi = 0, self.n_foods
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name_bytes(self._entry(mid)) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_foods:
+            entry = self._entry(lo)
+            if self._name_bytes(entry) == key:
+                return entry
+        return None
+
+    def row(self, name: str):
+        entry = self._find(name)
+        return entry[4] if entry is not None else None
+
+    # ---- MAPPING ----
+    def __getitem__(self, name: str) -> dict:
+        entry = self._find(name) if isinstance(name, str) else None
+        if entry is None:
+            raise KeyError(name)
+        offset, name_len, unit_len, category_len, row = entry
+        start = self._strings_offset + offset + name_len
+        unit = self._mm[start:start + unit_len].decode("utf-8")
+        category = self._mm[start + unit_len:start + unit_len + category_len].decode("utf-8")
+        values = self.table[row]
+        serving_g = float(values[-1])
+        return {
+            "name": name,
+            "category": category,
+            "per_100g": {c: round(float(v), 3) for c, v in zip(self.columns, values[:-1]) if not np.isnan(v)},
+            "serving_g": None if np.isnan(serving_g) else serving_g,
+            "serving_unit": unit or None,
+        }
+
+    def __contains__(self, name) -> bool:
+        return isinstance(name, str) and self._find(name) is not None
+
+    def __iter__(self):
+        for position in range(self.n_foods):
+            yield self._name_bytes(self._entry(position)).decode("utf-8")
+
+    def __len__(self) -> int:
+        return self.n_foods
+
+    def nutrient_values(self) -> np.ndarray:
+        """foods x columns per-100 g values, rows in iteration order."""
+        return self.table[:, :-1]
+
+
+# ===================== CLI =====================
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Compile a foods CSV into the mmap food DB format")
+    arg_parser.add_argument("csv", help="CSV in the data/foods.csv format")
+    arg_parser.add_argument("out", help="output file, e.g. data/foods.fdb (set FOOD_DB_BINARY to it)")
+    arg_parser.add_argument(
+        "--columns", default=",".join(NUTRIENTS + MICRONUTRIENTS), help="comma-separated nutrient columns"
+    )
+    args = arg_parser.parse_args(argv)
+
+    columns = tuple(c.strip() for c in args.columns.split(",") if c.strip())
+    count = build(args.csv, args.out, columns)
+    print(json.dumps({"foods": count, "columns": columns, "bytes": os.path.getsize(args.out)}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import os
+import re
+import threading
+
+# ===================== CONFIG =====================
+FUZZY_MAX_DISTANCE = int(os.getenv("FUZZY_MAX_DISTANCE", "2"))
+# One edit allowed per this many characters, so "ice" never matches "rice"
+FUZZY_CHARS_PER_EDIT = int(os.getenv("FUZZY_CHARS_PER_EDIT", "4"))
+FUZZY_INDEX_MAX = int(os.getenv("FUZZY_INDEX_MAX", "20000"))
+# Delete variants are generated from this many leading characters only, so
+# long names cost a few dozen variants instead of hundreds
+FUZZY_PREFIX_LENGTH = int(os.getenv("FUZZY_PREFIX_LENGTH", "7"))
+
+DIGITS_RE = re.compile(r"[\d./]+")
+
+
+# ===================== EDIT DISTANCE =====================
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Optimal string alignment distance (insert, delete, substitute,
+    swap adjacent). Returns max_distance + 1 once the bound is exceeded.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if (
+                prev2 is not None
+                and i > 1 and j > 1
+                and a[i - 1] == b[j - 2]
+                and a[i - 2] == b[j - 1]
+            ):
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, cur
+
+    return prev[-1]
+
+
+def _deletes(word: str, max_distance: int) -> set:
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+# ===================== SYMSPELL INDEX =====================
+class SymSpellIndex:
+    """
+    Symmetric-delete index over canonical food keys. A typo and the
+    original share at least one delete variant of their first
+    `prefix_length` characters, so candidates come from a few dict lookups
+    and only those are checked with edit_distance() on the whole key.
+    """
+
+    def __init__(self, max_distance: int = FUZZY_MAX_DISTANCE, max_keys: int = FUZZY_INDEX_MAX,
+                 prefix_length: int = FUZZY_PREFIX_LENGTH):
+        self.max_distance = max_distance
+        self.max_keys = max_keys
+        self.prefix_length = prefix_length
+        self.hits = 0
+        self.misses = 0
+        self._keys = set()
+        self._deletes = {}
+        self._lock = threading.Lock()
+
+    def allowed_distance(self, key: str) -> int:
+        return min(self.max_distance, len(key) // FUZZY_CHARS_PER_EDIT)
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            if key in self._keys or len(self._keys) >= self.max_keys:
+                return
+            self._keys.add(key)
+            for variant in _deletes(key[:self.prefix_length], self.max_distance):
+                self._deletes.setdefault(variant, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            if key not in self._keys:
+                return
+            self._keys.discard(key)
+            for variant in _deletes(key[:self.prefix_length], self.max_distance):
+                bucket = self._deletes.get(variant)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._deletes[variant]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys.clear()
+            self._deletes.clear()
+
+    def lookup(self, key: str):
+        """Closest known key within the allowed distance, or None."""
+        max_distance = self.allowed_distance(key)
+        if max_distance == 0:
+            self.misses += 1
+            return None
+
+        with self._lock:
+            if key in self._keys:
+                return key
+            candidates = set()
+            for variant in _deletes(key[:self.prefix_length], max_distance):
+                candidates |= self._deletes.get(variant, set())
+
+        # "2 roti" must never resolve to "3 roti"
+        numbers = DIGITS_RE.findall(key)
+        best, best_distance = None, max_distance + 1
+        for candidate in candidates:
+            if abs(len(candidate) - len(key)) > max_distance or DIGITS_RE.findall(candidate) != numbers:
+                continue
+            distance = edit_distance(key, candidate, max_distance)
+            if distance > max_distance:
+                continue
+            if distance < best_distance or (distance == best_distance and candidate < best):
+                best, best_distance = candidate, distance
+
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return best
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+# Every item key that has a cached nutrition answer
+food_index = SymSpellIndex()
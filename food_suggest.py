@@ -0,0 +1,149 @@
+import os
+import heapq
+import bisect
+import threading
+from collections import Counter
+
+from food_db import FOODS, FOODS_MAPPED
+from food_aliases import aliases_by_food
+
+# ===================== CONFIG =====================
+SUGGEST_LIMIT = int(os.getenv("SUGGEST_LIMIT", "10"))
+# Completions looked at per query; bounds the cost of one-letter prefixes
+SUGGEST_SCAN_MAX = int(os.getenv("SUGGEST_SCAN_MAX", "500"))
+
+
+def normalize_name(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+# ===================== PREFIX INDEX =====================
+class PrefixIndex:
+    """
+    Sorted array of (term, name) pairs searched with bisect. Every food is
+    indexed under its name, each later word ("biryani" finds "chicken
+    biryani") and its synonyms. Completions are ranked by how often the
+    food was resolved, local foods before learned ones, then by length.
+    """
+
+    def __init__(self):
+        self.popularity = Counter()
+        self._terms = []
+        self._sources = {}
+        self._synonyms = {}
+        self._lock = threading.Lock()
+
+    def _name_terms(self, name: str, synonyms) -> set:
+        words = name.split()
+        terms = {" ".join(words[i:]) for i in range(len(words))}
+        terms.update(normalize_name(s) for s in synonyms)
+        terms.discard("")
+        return terms
+
+    def add(self, name: str, source: str = "learned", synonyms=()) -> None:
+        name = normalize_name(name)
+        if not name:
+            return
+        with self._lock:
+            indexed = name in self._sources
+            # a local food stays local if the LLM later answers for it too
+            if self._sources.get(name) != "local":
+                self._sources[name] = source
+            known = self._synonyms.setdefault(name, set())
+            new = {normalize_name(s) for s in synonyms} - known
+            if indexed and not new:
+                return
+            known.update(new)
+            for term in self._name_terms(name, known):
+                entry = (term, name)
+                position = bisect.bisect_left(self._terms, entry)
+                if position == len(self._terms) or self._terms[position] != entry:
+                    self._terms.insert(position, entry)
+
+    def add_many(self, names, source: str = "learned", synonyms: dict = None) -> None:
+        """
+        Bulk add for startup: terms are collected and sorted once instead of
+        inserted one by one, outside the lock. Names already indexed are
+        left as they are.
+        """
+        synonyms = synonyms or {}
+        entries = {}
+        for name in names:
+            name = normalize_name(name)
+            if name and name not in entries:
+                entries[name] = {normalize_name(s) for s in synonyms.get(name, ())}
+        terms = sorted(
+            (term, name) for name, known in entries.items() for term in self._name_terms(name, known)
+        )
+
+        with self._lock:
+            fresh = {name for name in entries if name not in self._sources}
+            for name in fresh:
+                self._sources[name] = source
+                self._synonyms[name] = entries[name]
+            self._terms = list(heapq.merge(self._terms, (entry for entry in terms if entry[1] in fresh)))
+
+    def remove(self, name: str) -> None:
+        name = normalize_name(name)
+        with self._lock:
+            if self._sources.get(name) != "learned":
+                return
+            self._sources.pop(name, None)
+            self._synonyms.pop(name, None)
+            self.popularity.pop(name, None)
+            self._terms = [entry for entry in self._terms if entry[1] != name]
+
+    def bump(self, name: str, count: int = 1) -> None:
+        name = normalize_name(name)
+        if name in self._sources:
+            self.popularity[name] += count
+
+    def suggest(self, query: str, limit: int = SUGGEST_LIMIT) -> list:
+        query = normalize_name(query)
+        if not query:
+            return []
+
+        found = {}
+        terms = self._terms
+        position = bisect.bisect_left(terms, (query,))
+        scanned = 0
+        while position < len(terms) and scanned < SUGGEST_SCAN_MAX:
+            term, name = terms[position]
+            if not term.startswith(query):
+                break
+            # a match at the start of the name beats one inside it or on a synonym
+            found[name] = found.get(name, False) or name.startswith(query)
+            position += 1
+            scanned += 1
+
+        ranked = sorted(
+            found,
+            key=lambda name: (
+                not found[name],
+                -self.popularity[name],
+                self._sources.get(name) != "local",
+                len(name),
+                name,
+            ),
+        )
+        return [
+            {
+                "food_name": name,
+                "source": self._sources.get(name, "learned"),
+                "popularity": self.popularity[name],
+            }
+            for name in ranked[:limit]
+        ]
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+
+suggest_index = PrefixIndex()
+if FOODS_MAPPED:
+    threading.Thread(
+        target=lambda: suggest_index.add_many(FOODS, source="local", synonyms=aliases_by_food()),
+        daemon=True,
+    ).start()
+else:
+    suggest_index.add_many(FOODS, source="local", synonyms=aliases_by_food())
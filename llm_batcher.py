@@ -0,0 +1,128 @@
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# ===================== CONFIG =====================
+# Opt-in: gather the LLM-bound items of concurrent requests into one prompt
+LLM_MICROBATCH = os.getenv("LLM_MICROBATCH", "0") == "1"
+# How long the first request of a batch waits for others to join
+MICROBATCH_WINDOW_MS = float(os.getenv("MICROBATCH_WINDOW_MS", "15"))
+# A batch is sent as soon as it holds this many distinct items
+MICROBATCH_MAX_ITEMS = int(os.getenv("MICROBATCH_MAX_ITEMS", "20"))
+# Batches in flight at once; the next batch fills while earlier ones run
+MICROBATCH_MAX_INFLIGHT = int(os.getenv("MICROBATCH_MAX_INFLIGHT", "8"))
+
+# ===================== MICRO-BATCHER =====================
+class MicroBatcher:
+    """
+    Collects the items that concurrent requests would each send to the
+    LLM, for up to `window_ms` or `max_items`, and sends them as one
+    numbered prompt through fetch_foods(items). Each request gets back the
+    answers for its own items, in its own order. If the model's answers
+    don't line up with the items, every request falls back to its own
+    call. submit() returns a Future, so callers on the event loop can
+    await it without holding a thread; fetch() blocks on it.
+    """
+
+    def __init__(self, fetch_foods, window_ms: float = MICROBATCH_WINDOW_MS,
+                 max_items: int = MICROBATCH_MAX_ITEMS, max_inflight: int = MICROBATCH_MAX_INFLIGHT):
+        self.fetch_foods = fetch_foods
+        self.window = window_ms / 1000
+        self.max_items = max_items
+        self.batches = 0
+        self.requests = 0
+        self.items_sent = 0
+        self.fallbacks = 0
+        self._groups = []
+        self._distinct = set()
+        self._deadline = None
+        self._cond = threading.Condition()
+        self._worker = None
+        self._senders = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="microbatch")
+
+    @staticmethod
+    def _key(item: str) -> str:
+        return " ".join(item.lower().split())
+
+    def submit(self, items: list) -> Future:
+        future = Future()
+        # the request's contextvars (current_endpoint) follow its LLM call
+        context = contextvars.copy_context()
+        with self._cond:
+            self.requests += 1
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+            if not self._groups:
+                self._deadline = time.monotonic() + self.window
+            self._groups.append((items, future, context))
+            self._distinct.update(self._key(item) for item in items)
+            self._cond.notify()
+        return future
+
+    def fetch(self, items: list) -> list:
+        return self.submit(items).result()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._groups:
+                    self._cond.wait()
+                while len(self._distinct) < self.max_items:
+                    remaining = self._deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                groups, self._groups = self._groups, []
+                self._distinct = set()
+            # the batch is counted under its first request's endpoint
+            self._senders.submit(groups[0][2].copy().run, self._send, groups)
+
+    def _send(self, groups: list) -> None:
+        unique = {}
+        for items, _, _ in groups:
+            for item in items:
+                unique.setdefault(self._key(item), item)
+
+        try:
+            foods = self.fetch_foods(list(unique.values()))
+        except BaseException as e:
+            for _, future, _ in groups:
+                future.set_exception(e)
+            return
+
+        with self._cond:
+            self.batches += 1
+            self.items_sent += len(unique)
+
+        if len(foods) != len(unique):
+            with self._cond:
+                self.fallbacks += len(groups)
+            for items, future, context in groups:
+                self._senders.submit(context.run, self._fallback, items, future)
+            return
+
+        answers = dict(zip(unique, foods))
+        for items, future, _ in groups:
+            # each request learns its own copy of a shared answer
+            future.set_result([dict(answers[self._key(item)]) for item in items])
+
+    def _fallback(self, items: list, future: Future) -> None:
+        try:
+            future.set_result(self.fetch_foods(items))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": LLM_MICROBATCH,
+            "window_ms": self.window * 1000,
+            "max_items": self.max_items,
+            "requests": self.requests,
+            "batches": self.batches,
+            "items_sent": self.items_sent,
+            "fallbacks": self.fallbacks,
+            "pending": len(self._groups),
+        }
@@ -1,17 +1,32 @@
 import os
+import asyncio
+import hashlib
 import tempfile
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, Dict, List
 
 from Image_search import detect_foods_from_image
 from speech_text import transcribe_audio
 from voice_search import get_voice_nutrition
-from Type_Search import get_nutrition
+from Type_Search import aget_nutrition, get_nutrition_batch, add_micronutrients, micro_batcher, BATCH_MAX_MEALS
 from Ai_coach_chat import ai_fitness_chat
+from nutrition_cache import (
+    negative_cache,
+    current_endpoint,
+    cache_report,
+    invalidate_cached,
+    flush_cache,
+)
+from food_suggest import suggest_index, SUGGEST_LIMIT
+from cache_warmup import warmup, record_query, WARMUP_LOG, WARMUP_REQUIRED_FOR_READY
+from food_consolidation import consolidation
+from food_db import LLM_SAMPLE_LOG
+from work_limits import nutrition_llm_limit, limits_report
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 # ------------------ APP INIT ------------------
 app = FastAPI(title="Nutrition & AI Fitness API")
@@ -25,47 +40,103 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ------------------ CACHE WARM-UP ------------------
+@app.on_event("startup")
+def start_cache_warmup():
+    if WARMUP_LOG and os.path.exists(WARMUP_LOG):
+        warmup.start(WARMUP_LOG)
+
+# ------------------ LEARNED FOOD CONSOLIDATION ------------------
+@app.on_event("startup")
+def start_food_consolidation():
+    # runs only with a sample log, but every worker picks up promotions
+    consolidation.start(LLM_SAMPLE_LOG)
+
 # ------------------ REQUEST MODELS ------------------
 class FoodRequest(BaseModel):
     food_name: str
+    include_micronutrients: bool = False
+
+class BatchFoodRequest(BaseModel):
+    meals: List[str]
+    include_micronutrients: bool = False
 
 class ChatRequest(BaseModel):
     message: str
     food_context: Optional[Dict] = None
     chat_history: Optional[List[Dict[str, str]]] = None
 
+class InvalidateRequest(BaseModel):
+    food: Optional[str] = None
+    prefix: Optional[str] = None
+    tiers: Optional[List[str]] = None
+
+class FlushRequest(BaseModel):
+    tier: str
+
 # ------------------ TEXT FOOD SEARCH ------------------
 @app.post("/search-food")
 async def search_food(data: FoodRequest):
     food_input = data.food_name.strip()
+    current_endpoint.set("/search-food")
 
     if not food_input:
         raise HTTPException(status_code=400, detail="Food input cannot be empty")
 
-    return await run_in_threadpool(get_nutrition, food_input)
+    await asyncio.to_thread(record_query, food_input, "/search-food")
+    result = await aget_nutrition(food_input)
+    return add_micronutrients(result) if data.include_micronutrients else result
+
+# ------------------ BATCH FOOD SEARCH ------------------
+@app.post("/search-food/batch")
+async def search_food_batch(data: BatchFoodRequest):
+    current_endpoint.set("/search-food/batch")
+
+    if not data.meals:
+        raise HTTPException(status_code=400, detail="Meals cannot be empty")
+    if len(data.meals) > BATCH_MAX_MEALS:
+        raise HTTPException(status_code=400, detail=f"Maximum {BATCH_MAX_MEALS} meals allowed")
+
+    meals = [meal.strip() for meal in data.meals]
+    for meal in meals:
+        if meal:
+            await asyncio.to_thread(record_query, meal, "/search-food/batch")
+
+    # blocking fan-out; runs on the nutrition-LLM pool, not the shared one
+    results = await nutrition_llm_limit.run_sync(get_nutrition_batch, meals)
+    if data.include_micronutrients:
+        results = [r if "error" in r else add_micronutrients(r) for r in results]
+
+    return {"results": [{"index": i, "meal": meal, **r} for i, (meal, r) in enumerate(zip(meals, results))]}
+
+# ------------------ FOOD AUTOCOMPLETE ------------------
+@app.get("/suggest-food")
+async def suggest_food(q: str = "", limit: int = SUGGEST_LIMIT):
+    # in-memory and sub-millisecond, so no threadpool hop
+    return {"query": q, "suggestions": suggest_index.suggest(q, max(1, min(limit, 50)))}
 
 # ------------------ VOICE → FOOD SEARCH ------------------
 @app.post("/voice-food")
-async def voice_food(file: UploadFile = File(...)):
+async def voice_food(file: UploadFile = File(...), include_micronutrients: bool = False):
     tmp_path = None
+    current_endpoint.set("/voice-food")
 
     try:
         with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
             tmp.write(await file.read())
             tmp_path = tmp.name
 
-        text = await run_in_threadpool(transcribe_audio, tmp_path)
+        text = await transcribe_audio(tmp_path)
 
         if not text.strip():
             return {"transcript": "", "foods": [], "total_nutrition": {}}
 
-        nutrition = await run_in_threadpool(get_voice_nutrition, text)
+        await asyncio.to_thread(record_query, text, "/voice-food")
+        nutrition = await get_voice_nutrition(text)
+        if include_micronutrients:
+            nutrition = add_micronutrients(nutrition)
 
-        return {
-            "transcript": text,
-            "foods": nutrition["foods"],
-            "total_nutrition": nutrition["total_nutrition"],
-        }
+        return {"transcript": text, **nutrition}
 
     except Exception as e:
         print("❌ VOICE ERROR:", e)
@@ -81,8 +152,7 @@ async def ai_chat(data: ChatRequest):
     if not data.message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
 
-    return await run_in_threadpool(
-        ai_fitness_chat,
+    return await ai_fitness_chat(
         data.message,
         data.food_context,
         data.chat_history or [],
@@ -90,27 +160,40 @@ async def ai_chat(data: ChatRequest):
 
 # ------------------ IMAGE → FOOD SEARCH ------------------
 @app.post("/image-search")
-async def image_search(file: UploadFile = File(...)):
+async def image_search(file: UploadFile = File(...), include_micronutrients: bool = False):
     tmp_path = None
+    current_endpoint.set("/image-search")
 
     try:
+        content = await file.read()
+
+        # Images already known to contain no food fail fast
+        image_key = "image:" + hashlib.sha256(content).hexdigest()
+        # negative_cache and the query log may touch SQLite or disk
+        failure = await asyncio.to_thread(negative_cache.get, image_key)
+        if failure is not None:
+            raise HTTPException(**failure)
+
         suffix = os.path.splitext(file.filename)[1]
         with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(await file.read())
+            tmp.write(content)
             tmp_path = tmp.name
 
-        food_names = await run_in_threadpool(
-            detect_foods_from_image,
-            tmp_path
-        )
+        food_names = await detect_foods_from_image(tmp_path)
 
         if not food_names:
+            await asyncio.to_thread(
+                negative_cache.set,
+                image_key,
+                {"status_code": 400, "detail": "No food detected in image"},
+            )
             raise HTTPException(status_code=400, detail="No food detected in image")
 
-        nutrition = await run_in_threadpool(
-            get_nutrition,
-            food_names
-        )
+        await asyncio.to_thread(record_query, food_names, "/image-search")
+
+        nutrition = await aget_nutrition(food_names)
+        if include_micronutrients:
+            nutrition = add_micronutrients(nutrition)
 
         return {
             "input_type": "image",
@@ -135,3 +218,45 @@ async def image_search(file: UploadFile = File(...)):
 @app.api_route("/health", methods=["GET", "HEAD"])
 def health():
     return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    report = {"ready": warmup.ready, "warmup": warmup.report()}
+    if WARMUP_REQUIRED_FOR_READY and not warmup.ready:
+        raise HTTPException(status_code=503, detail=report)
+    return report
+
+
+# ------------------ CACHE ADMIN ------------------
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API disabled (ADMIN_TOKEN not set)")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.get("/admin/cache", dependencies=[Depends(require_admin)])
+def admin_cache_stats(top: int = 10):
+    return {
+        **cache_report(top),
+        "consolidation": consolidation.report(),
+        "microbatch": micro_batcher.stats(),
+    }
+
+@app.get("/admin/limits", dependencies=[Depends(require_admin)])
+def admin_limits():
+    # active and queued provider calls per endpoint class
+    return limits_report()
+
+@app.post("/admin/cache/invalidate", dependencies=[Depends(require_admin)])
+def admin_cache_invalidate(data: InvalidateRequest):
+    try:
+        return invalidate_cached(data.food, data.prefix, data.tiers)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/admin/cache/flush", dependencies=[Depends(require_admin)])
+def admin_cache_flush(data: FlushRequest):
+    try:
+        return flush_cache(data.tier)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,146 @@
+import numpy as np
+
+NUTRIENTS = ("carbohydrates_g", "protein_g", "fat_g", "calories_kcal")
+# Optional columns of the local table; never asked of the LLM
+MICRONUTRIENTS = ("fiber_g", "sugar_g", "sodium_mg", "iron_mg", "calcium_mg")
+
+
+# ===================== MATRIX =====================
+class NutrientMatrix:
+    """
+    Foods x nutrients float64 array with a name -> row index.
+    Rows hold per-100 g values for a food table, or absolute values for
+    the foods of a meal log; totals, scaling and grouping are single
+    vectorized operations, and dicts are only built on the way out.
+    """
+
+    def __init__(self, names: list, values, columns: tuple = NUTRIENTS):
+        self.columns = tuple(columns)
+        self.names = list(names)
+        self.index = {name: row for row, name in enumerate(self.names)}
+        self.values = np.asarray(values, dtype=np.float64).reshape(len(self.names), len(self.columns))
+
+    @classmethod
+    def from_records(cls, records: dict, columns: tuple = NUTRIENTS):
+        """From {name: {"per_100g": {...}}} rows such as food_db.FOODS; gaps are NaN."""
+        names = list(records)
+        values = [[records[name]["per_100g"].get(c, np.nan) for c in columns] for name in names]
+        return cls(names, values, columns)
+
+    @classmethod
+    def from_foods(cls, foods: list, columns: tuple = NUTRIENTS):
+        """From response-shaped food dicts; values are taken as absolute."""
+        names = [food.get("food_name", "") for food in foods]
+        values = [[float(food.get(c) or 0) for c in columns] for food in foods]
+        return cls(names, values, columns)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, name: str, row: dict) -> int:
+        """Appends (or overwrites) one food's row; returns its row id."""
+        values = np.array([[row.get(c, np.nan) for c in self.columns]], dtype=np.float64)
+        if name in self.index:
+            self.values[self.index[name]] = values[0]
+        else:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+            self.values = np.vstack([self.values, values])
+        return self.index[name]
+
+    # ---- LOOKUP ----
+    def row_id(self, name: str):
+        return self.index.get(name)
+
+    def ids(self, names: list) -> np.ndarray:
+        return np.fromiter((self.row_id(name) for name in names), dtype=np.intp, count=len(names))
+
+    def rows(self, ids) -> np.ndarray:
+        return self.values[np.asarray(ids, dtype=np.intp)]
+
+    # ---- ARITHMETIC ----
+    def scale(self, ids, grams) -> np.ndarray:
+        """Absolute values of `grams` of each food: one row per (id, grams) pair."""
+        return self.rows(ids) * (np.asarray(grams, dtype=np.float64) / 100)[:, None]
+
+    def totals(self, rows=None) -> np.ndarray:
+        values = self.values if rows is None else rows
+        return values.sum(axis=0)
+
+    @staticmethod
+    def group_totals(rows: np.ndarray, groups, n_groups: int) -> np.ndarray:
+        """Sums rows per group id (meal, day, user) in one pass: (n_groups, nutrients)."""
+        out = np.zeros((n_groups, rows.shape[1]), dtype=np.float64)
+        np.add.at(out, np.asarray(groups, dtype=np.intp), rows)
+        return out
+
+    # ---- OUTPUT ----
+    def to_dict(self, vector, ndigits: int = 2) -> dict:
+        return {c: round(float(v), ndigits) for c, v in zip(self.columns, vector)}
+
+    def to_dicts(self, rows=None, ndigits: int = 2) -> list:
+        values = self.values if rows is None else rows
+        return [self.to_dict(row, ndigits) for row in np.round(values, ndigits)]
+
+
+class LayeredNutrientMatrix(NutrientMatrix):
+    """
+    Read-only base rows, such as the float32 view of an mmap'd food table,
+    with a small float64 matrix on top for foods added at runtime. Base
+    rows are found through `base_row(name)` (row number or None) and are
+    never copied, so workers keep sharing the mapped pages.
+    """
+
+    def __init__(self, base_values, base_row, columns: tuple = NUTRIENTS):
+        self.columns = tuple(columns)
+        self.base = base_values
+        self._base_row = base_row
+        self.extra = NutrientMatrix([], np.empty((0, len(self.columns))), self.columns)
+
+    def __len__(self) -> int:
+        return len(self.base) + len(self.extra)
+
+    @property
+    def values(self) -> np.ndarray:
+        """All rows as one array; copies the base, so keep it off hot paths."""
+        return np.vstack([self.base, self.extra.values])
+
+    def add(self, name: str, row: dict) -> int:
+        # a later row for a base food shadows it in the extra matrix
+        return len(self.base) + self.extra.add(name, row)
+
+    def row_id(self, name: str):
+        row = self.extra.row_id(name)
+        if row is not None:
+            return len(self.base) + row
+        return self._base_row(name)
+
+    def rows(self, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.intp)
+        out = np.empty((len(ids), len(self.columns)), dtype=np.float64)
+        in_base = ids < len(self.base)
+        out[in_base] = self.base[ids[in_base]]
+        out[~in_base] = self.extra.values[ids[~in_base] - len(self.base)]
+        return out
+
+
+# ===================== AGGREGATION HELPERS =====================
+def nutrient_totals(foods: list, columns: tuple = NUTRIENTS) -> dict:
+    """
+    Totals of response-shaped food dicts, e.g. one meal. A plain loop: for
+    a handful of foods it is faster than building a matrix.
+    """
+    total = dict.fromkeys(columns, 0.0)
+    for food in foods:
+        for c in columns:
+            total[c] += float(food.get(c) or 0)
+    return {c: round(v, 2) for c, v in total.items()}
+
+
+def meal_totals(meals: list, columns: tuple = NUTRIENTS) -> list:
+    """Totals for many meals (lists of food dicts) with one grouped sum."""
+    foods = [food for meal in meals for food in meal]
+    groups = [i for i, meal in enumerate(meals) for _ in meal]
+    matrix = NutrientMatrix.from_foods(foods, columns)
+    sums = NutrientMatrix.group_totals(matrix.values, groups, len(meals))
+    return matrix.to_dicts(sums)
@@ -0,0 +1,1018 @@
+import os
+import re
+import sys
+import copy
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+import contextvars
+from collections import OrderedDict, Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from food_db import FOODS, food_from_db, food_from_record, record_from_answer, find_food, find_record, log_sample
+from quantity_parser import parse_quantity, format_quantity
+from food_matcher import FUZZY_INDEX_MAX, food_index
+from semantic_cache import SEMANTIC_INDEX_MAX, semantic_index
+from food_suggest import suggest_index
+from food_aliases import FOOD_ALIASES, alias_for, canonical_food
+
+# ===================== CONFIG =====================
+CACHE_TTL_SECONDS = float(os.getenv("NUTRITION_CACHE_TTL", "3600"))
+CACHE_MAX_ENTRIES = int(os.getenv("NUTRITION_CACHE_SIZE", "1024"))
+
+# Stale-while-revalidate: an expired entry is served for up to STALE_GRACE
+# seconds while it is refreshed in the background. A failed refresh keeps it
+# servable for another grace window, but never past MAX_STALE after expiry.
+CACHE_STALE_GRACE = float(os.getenv("NUTRITION_CACHE_STALE_GRACE", "600"))
+CACHE_MAX_STALE = float(os.getenv("NUTRITION_CACHE_MAX_STALE", "86400"))
+# Only one worker on the node refreshes a key; the lease lapses after this
+CACHE_REFRESH_LEASE = float(os.getenv("NUTRITION_CACHE_REFRESH_LEASE", "120"))
+
+# Inputs with no food or an unparseable answer; short-lived and sized
+# separately so junk can't evict good entries
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "300"))
+NEGATIVE_CACHE_SIZE = int(os.getenv("NEGATIVE_CACHE_SIZE", "256"))
+
+# Shared on-disk cache for all workers on a node ("" disables it)
+CACHE_DB_PATH = os.getenv("NUTRITION_CACHE_DB", "nutrition_cache.db")
+CACHE_DB_MAX_ROWS = int(os.getenv("NUTRITION_CACHE_DB_MAX_ROWS", "100000"))
+
+# How often each worker applies invalidations made by other workers
+CACHE_SYNC_INTERVAL = float(os.getenv("NUTRITION_CACHE_SYNC_INTERVAL", "2"))
+TOP_KEYS_TRACKED = 5000
+
+# Long food lists are sent to the LLM in chunks of FANOUT_CHUNK_SIZE items,
+# at most FANOUT_CONCURRENCY chunks at a time per request, on a pool of
+# FANOUT_WORKERS threads shared by all requests
+FANOUT_CHUNK_SIZE = int(os.getenv("FANOUT_CHUNK_SIZE", "8"))
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "4"))
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "32"))
+
+# Separators users put between foods: "rice, dal and 2 roti". "and", "&"
+# and "+" also join the words of one dish ("mac and cheese")
+FOOD_SEPARATOR_RE = re.compile(r",|;|\n")
+FOOD_JOINER_RE = re.compile(r"\+|&|\band\b", re.IGNORECASE)
+
+
+# ===================== CANONICAL KEYS =====================
+def split_food_items(food_input: str) -> list:
+    """
+    "rice, dal and 2 roti" -> ["rice", "dal", "2 roti"]. A joiner only
+    splits when every part is a known food and the whole isn't, so
+    "mac and cheese" goes to the model as one dish.
+    """
+    items = []
+    for piece in FOOD_SEPARATOR_RE.split(food_input):
+        parts = [part.strip() for part in FOOD_JOINER_RE.split(piece) if part.strip()]
+        if len(parts) > 1 and (known_food(piece) or not all(known_food(part) for part in parts)):
+            parts = [piece.strip()]
+        items += parts
+    return items
+
+
+def known_food(item: str) -> bool:
+    """Whether the item names a local, aliased or learned food."""
+    item_key = canonicalize_item(item)
+    for name in dict.fromkeys([item_key, parse_quantity(item_key)["food"]]):
+        if find_food(name) is not None:
+            return True
+        if name in food_cache or name.endswith("s") and name[:-1] in food_cache:
+            return True
+    return False
+
+
+def canonicalize_item(item: str) -> str:
+    """
+    "Rice 200gm", "200 grams of rice" and "200g rice" all become "200 g rice";
+    regional names and spellings map to one food ("2 chapathi" -> "2 roti").
+    """
+    item = item.lower()
+    # keep digits, fractions and decimals ("1/2", "1.5"), drop other punctuation
+    item = re.sub(r"[^\w\s./]", " ", item)
+    item = " ".join(item.split()).strip(" ./")
+    if not item:
+        return item
+
+    # "chapati", "2 phulka" and "2 rotis" share the key of "roti"
+    food = alias_for(item)
+    if food is not None:
+        return food
+    parsed = parse_quantity(item)
+    parsed["food"] = canonical_food(parsed["food"])
+    return format_quantity(parsed)
+
+
+def canonicalize_food_input(food_input: str) -> str:
+    """
+    "Dal  and 2 Roti" and "2 roti, dal" both become "2 roti, dal".
+    """
+    items = sorted(canonicalize_item(item) for item in split_food_items(food_input))
+    return ", ".join(item for item in items if item)
+
+
+def key_matches(kind: str, pattern: str, key: str) -> bool:
+    """
+    Invalidation predicate. "food" matches item keys naming that food with
+    or without a quantity ("dosa", "2 dosa") and meal keys containing one;
+    "prefix" matches keys starting with the pattern; "all" matches everything.
+    """
+    if kind == "all":
+        return True
+    if kind == "prefix":
+        return key.startswith(pattern)
+    if kind == "food":
+        # "voice:2 dosa, chutney" -> "2 dosa", "chutney"; "masala dosa" is
+        # a different food
+        items = key.split(":", 1)[-1].split(", ")
+        return any(item == pattern or parse_quantity(item)["food"] == pattern for item in items)
+    return False
+
+
+# ===================== SQLITE STORE =====================
+class SQLiteStore:
+    """
+    Persistent cache rows shared by every uvicorn worker on the node.
+    WAL mode lets readers in all processes run alongside one writer.
+    """
+
+    PRUNE_EVERY = 500
+
+    def __init__(
+        self,
+        path: str,
+        max_rows: int = CACHE_DB_MAX_ROWS,
+        retain: float = CACHE_MAX_STALE,
+    ):
+        self.path = path
+        self.max_rows = max_rows
+        # expired rows are kept this long so they can still be served stale
+        self.retain = retain
+        self._local = threading.local()
+        self._writes = 0
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS nutrition_cache (
+                tier TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (tier, key)
+            ) WITHOUT ROWID
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_nutrition_cache_expires "
+            "ON nutrition_cache (expires_at)"
+        )
+        # Admin invalidations, replayed by every worker against its memory
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS nutrition_cache_invalidations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tier TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                pattern TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threadpool threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, tier: str, key: str):
+        """Returns (value, expires_at) or None. May be expired, up to `retain`."""
+        try:
+            row = self._conn().execute(
+                "SELECT value, expires_at FROM nutrition_cache "
+                "WHERE tier = ? AND key = ? AND expires_at > ?",
+                (tier, key, time.time() - self.retain),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print("⚠️ CACHE DB ERROR:", repr(e))
+            return None
+
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, tier: str, key: str, value, ttl: float) -> None:
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO nutrition_cache (tier, key, value, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (tier, key, json.dumps(value, separators=(",", ":")), time.time() + ttl),
+            )
+        except sqlite3.Error as e:
+            print("⚠️ CACHE DB ERROR:", repr(e))
+            return
+
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def delete(self, tier: str, key: str) -> None:
+        try:
+            self._conn().execute(
+                "DELETE FROM nutrition_cache WHERE tier = ? AND key = ?", (tier, key)
+            )
+        except sqlite3.Error as e:
+            print("⚠️ CACHE DB ERROR:", repr(e))
+
+    def clear(self, tier: str) -> None:
+        try:
+            self._conn().execute("DELETE FROM nutrition_cache WHERE tier = ?", (tier,))
+        except sqlite3.Error as e:
+            print("⚠️ CACHE DB ERROR:", repr(e))
+
+    def claim(self, tier: str, key: str, ttl: float) -> bool:
+        """Atomically takes a cross-worker lease; False if someone else holds it."""
+        try:
+            cursor = self._conn().execute(
+                "INSERT INTO nutrition_cache (tier, key, value, expires_at) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (tier, key) DO UPDATE SET "
+                "value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE nutrition_cache.expires_at <= ?",
+                (tier, key, str(os.getpid()), time.time() + ttl, time.time()),
+            )
+        except sqlite3.Error as e:
+            print("⚠️ CACHE DB ERROR:", repr(e))
+            return True
+        return cursor.rowcount == 1
+
+    def count(self, tier: str) -> int:
+        try:
+            return self._conn().execute(
+                "SELECT COUNT(*) FROM nutrition_cache WHERE tier = ? AND expires_at > ?",
+                (tier, time.time()),
+            ).fetchone()[0]
+        except sqlite3.Error as e:
+            print("⚠️ CACHE DB ERROR:", repr(e))
+            return 0
+
+    def keys(self, tier: str, limit: int) -> list:
+        """Live keys of a tier, longest-lived first."""
+        try:
+            rows = self._conn().execute(
+                "SELECT key FROM nutrition_cache WHERE tier = ? AND expires_at > ? "
+                "ORDER BY expires_at DESC LIMIT ?",
+                (tier, time.time(), limit),
+            ).fetchall()
+        except sqlite3.Error as e:
+            print("⚠️ CACHE DB ERROR:", repr(e))
+            return []
+        return [row[0] for row in rows]
+
+    def invalidate(self, tier: str, kind: str, pattern: str) -> int:
+        """Deletes matching rows and records the invalidation for other workers."""
+        try:
+            conn = self._conn()
+            if kind == "all":
+                removed = conn.execute(
+                    "DELETE FROM nutrition_cache WHERE tier = ?", (tier,)
+                ).rowcount
+            else:
+                keys = [
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT key FROM nutrition_cache WHERE tier = ?", (tier,)
+                    )
+                    if key_matches(kind, pattern, row[0])
+                ]
+                conn.executemany(
+                    "DELETE FROM nutrition_cache WHERE tier = ? AND key = ?",
+                    [(tier, key) for key in keys],
+                )
+                removed = len(keys)
+            conn.execute(
+                "INSERT INTO nutrition_cache_invalidations (tier, kind, pattern, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (tier, kind, pattern, time.time()),
+            )
+        except sqlite3.Error as e:
+            print("⚠️ CACHE DB ERROR:", repr(e))
+            return 0
+        return removed
+
+    def invalidations(self, tier: str, after_id: int) -> list:
+        """[(id, kind, pattern)] recorded for a tier after `after_id`."""
+        try:
+            return self._conn().execute(
+                "SELECT id, kind, pattern FROM nutrition_cache_invalidations "
+                "WHERE tier = ? AND id > ? ORDER BY id",
+                (tier, after_id),
+            ).fetchall()
+        except sqlite3.Error as e:
+            print("⚠️ CACHE DB ERROR:", repr(e))
+            return []
+
+    def last_invalidation_id(self) -> int:
+        try:
+            row = self._conn().execute(
+                "SELECT MAX(id) FROM nutrition_cache_invalidations"
+            ).fetchone()
+        except sqlite3.Error as e:
+            print("⚠️ CACHE DB ERROR:", repr(e))
+            return 0
+        return row[0] or 0
+
+    def size_bytes(self) -> int:
+        return sum(
+            os.path.getsize(path)
+            for path in (self.path, self.path + "-wal")
+            if os.path.exists(path)
+        )
+
+    def prune(self) -> None:
+        """Drops rows past retention, then the soonest-to-expire rows over max_rows."""
+        try:
+            conn = self._conn()
+            conn.execute(
+                "DELETE FROM nutrition_cache WHERE expires_at <= ?",
+                (time.time() - self.retain,),
+            )
+            conn.execute(
+                "DELETE FROM nutrition_cache WHERE (tier, key) IN ("
+                "SELECT tier, key FROM nutrition_cache ORDER BY expires_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_rows,),
+            )
+            conn.execute(
+                "DELETE FROM nutrition_cache_invalidations WHERE created_at <= ?",
+                (time.time() - self.retain,),
+            )
+        except sqlite3.Error as e:
+            print("⚠️ CACHE DB ERROR:", repr(e))
+
+
+def open_store(path: str = CACHE_DB_PATH):
+    if not path:
+        return None
+    try:
+        return SQLiteStore(path)
+    except sqlite3.Error as e:
+        print("⚠️ CACHE DB DISABLED:", repr(e))
+        return None
+
+
+# ===================== METRICS =====================
+# Set by main.py per request; work_limits.run_sync carries it into the worker thread
+current_endpoint = contextvars.ContextVar("current_endpoint", default="internal")
+
+# endpoint -> {"<tier>_hit", "<tier>_stale", "<tier>_miss", "llm_calls"} counts
+endpoint_stats = defaultdict(Counter)
+_metrics_lock = threading.Lock()
+
+
+def record_event(event: str) -> None:
+    with _metrics_lock:
+        endpoint_stats[current_endpoint.get()][event] += 1
+
+
+def record_llm_call() -> None:
+    record_event("llm_calls")
+
+
+# ===================== LRU + TTL CACHE =====================
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+    Values are deep-copied in and out so callers can't mutate cached data.
+
+    With a `store`, memory acts as a per-process front for the shared
+    SQLite rows stored under `tier`.
+
+    With a `refresher(key) -> value`, expired entries are served stale
+    inside the grace window while one background refresh swaps in a new
+    value (stale-while-revalidate). Without one, expired entries are misses.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = CACHE_MAX_ENTRIES,
+        ttl: float = CACHE_TTL_SECONDS,
+        tier: str = "default",
+        store: SQLiteStore = None,
+        stale_grace: float = CACHE_STALE_GRACE,
+        max_stale: float = CACHE_MAX_STALE,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.tier = tier
+        self.store = store
+        self.stale_grace = stale_grace
+        self.max_stale = max_stale
+        self.refresher = None
+        self.hits = 0
+        self.misses = 0
+        self.store_hits = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.key_hits = Counter()
+        self._data = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._next_sync = 0.0
+        self._last_invalidation = store.last_invalidation_id() if store is not None else 0
+
+    def get(self, key: str):
+        self._sync()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, stale_until, value = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    self._count_hit(key, "hit")
+                    return copy.deepcopy(value)
+                if self.refresher is not None and stale_until > now:
+                    self._data.move_to_end(key)
+                    self.stale_hits += 1
+                    self._count_hit(key, "stale")
+                    self._schedule_refresh(key)
+                    return copy.deepcopy(value)
+                del self._data[key]
+
+        if self.store is not None:
+            row = self.store.get(self.tier, key)
+            if row is not None:
+                value, expires_at = row
+                ttl = expires_at - time.time()
+                if ttl > 0 or self.refresher is not None and -ttl < min(self.stale_grace, self.max_stale):
+                    self._remember(key, copy.deepcopy(value), ttl)
+                    with self._lock:
+                        if ttl > 0:
+                            self.hits += 1
+                            self.store_hits += 1
+                            self._count_hit(key, "hit")
+                        else:
+                            self.stale_hits += 1
+                            self._count_hit(key, "stale")
+                            self._schedule_refresh(key)
+                    return value
+
+        with self._lock:
+            self.misses += 1
+        record_event(f"{self.tier}_miss")
+        return None
+
+    def __contains__(self, key: str) -> bool:
+        # no hit or miss counted and no refresh scheduled
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return True
+        return self.store is not None and self.store.get(self.tier, key) is not None
+
+    def _count_hit(self, key: str, outcome: str) -> None:
+        # caller holds self._lock
+        self.key_hits[key] += 1
+        if len(self.key_hits) > TOP_KEYS_TRACKED:
+            self.key_hits = Counter(dict(self.key_hits.most_common(TOP_KEYS_TRACKED // 2)))
+        record_event(f"{self.tier}_{outcome}")
+
+    def set(self, key: str, value) -> None:
+        self._remember(key, copy.deepcopy(value), self.ttl)
+        if self.store is not None:
+            self.store.set(self.tier, key, value, self.ttl)
+
+    def _remember(self, key: str, value, ttl: float) -> None:
+        expires_at = time.monotonic() + ttl
+        stale_until = expires_at + min(self.stale_grace, self.max_stale)
+        with self._lock:
+            self._data[key] = (expires_at, stale_until, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    # ---- STALE-WHILE-REVALIDATE ----
+    def _schedule_refresh(self, key: str) -> None:
+        # caller holds self._lock
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        refresh_executor.submit(self._refresh, key)
+
+    def _refresh(self, key: str) -> None:
+        lease = f"refresh:{self.tier}:{key}"
+        leased = False
+        try:
+            if self.store is not None:
+                row = self.store.get(self.tier, key)
+                if row is not None and row[1] > time.time():
+                    # another worker already refreshed it
+                    self._remember(key, row[0], row[1] - time.time())
+                    return
+                leased = self.store.claim("lease", lease, CACHE_REFRESH_LEASE)
+                if not leased:
+                    # another worker is refreshing it; stay stale until its row lands
+                    return
+            value = self.refresher(key)
+            if value is None:
+                raise ValueError("refresher returned no value")
+        except Exception as e:
+            print(f"⚠️ CACHE REFRESH FAILED ({self.tier}):", repr(e))
+            with self._lock:
+                self.refresh_failures += 1
+                entry = self._data.get(key)
+                if entry is not None:
+                    # keep serving stale for another grace window, up to max_stale
+                    expires_at, _, stale_value = entry
+                    stale_until = min(
+                        time.monotonic() + self.stale_grace,
+                        expires_at + self.max_stale,
+                    )
+                    self._data[key] = (expires_at, stale_until, stale_value)
+        else:
+            self.set(key, value)
+            with self._lock:
+                self.refreshes += 1
+        finally:
+            if leased:
+                self.store.delete("lease", lease)
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+        if self.store is not None:
+            self.store.delete(self.tier, key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+        if self.store is not None:
+            self.store.clear(self.tier)
+
+    # ---- INVALIDATION ----
+    def invalidate(self, kind: str, pattern: str = "") -> int:
+        """Removes matching keys here, in the store and (via _sync) in other workers."""
+        removed = self._invalidate_local(kind, pattern)
+        if self.store is not None:
+            removed = max(removed, self.store.invalidate(self.tier, kind, pattern))
+        return removed
+
+    def _invalidate_local(self, kind: str, pattern: str) -> int:
+        with self._lock:
+            keys = [key for key in self._data if key_matches(kind, pattern, key)]
+            for key in keys:
+                del self._data[key]
+                self.key_hits.pop(key, None)
+        return len(keys)
+
+    def _sync(self) -> None:
+        if self.store is None or time.monotonic() < self._next_sync:
+            return
+        self._next_sync = time.monotonic() + CACHE_SYNC_INTERVAL
+        for record_id, kind, pattern in self.store.invalidations(self.tier, self._last_invalidation):
+            self._last_invalidation = record_id
+            self._invalidate_local(kind, pattern)
+
+    # ---- INTROSPECTION ----
+    def memory_bytes(self) -> int:
+        """Approximate: keys plus the JSON size of each value."""
+        with self._lock:
+            entries = list(self._data.items())
+        return sum(
+            sys.getsizeof(key) + len(json.dumps(value, separators=(",", ":")))
+            for key, (_, _, value) in entries
+        )
+
+    def top_keys(self, n: int = 10) -> list:
+        with self._lock:
+            return [{"key": key, "hits": hits} for key, hits in self.key_hits.most_common(n)]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._data),
+            "stored": self.store.count(self.tier) if self.store is not None else None,
+            "memory_bytes": self.memory_bytes(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "store_hits": self.store_hits,
+            "stale_hits": self.stale_hits,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stale_ratio": round(self.stale_hits / lookups, 4) if lookups else 0.0,
+            "miss_ratio": round(self.misses / lookups, 4) if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Background stale-while-revalidate refreshes; small so they can't crowd out live requests
+refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout")
+
+store = open_store()
+
+# Whole-request results keyed on canonicalize_food_input()
+meal_cache = TTLCache(tier="meal", store=store)
+
+# Per-100 g records learned from LLM answers, keyed on the food name only,
+# so any quantity of a food answered once is scaled locally
+food_cache = TTLCache(maxsize=CACHE_MAX_ENTRIES * 4, tier="food", store=store)
+
+# Whole LLM answers keyed on canonicalize_item(), for answers whose weight
+# couldn't be worked out (so they can't go into food_cache)
+item_cache = TTLCache(maxsize=CACHE_MAX_ENTRIES * 4, tier="item", store=store)
+
+# {"status_code", "detail"} of the failure, keyed like meal_cache
+# (voice: and image: prefixes for the other endpoints)
+negative_cache = TTLCache(
+    maxsize=NEGATIVE_CACHE_SIZE,
+    ttl=NEGATIVE_CACHE_TTL,
+    tier="negative",
+    store=store,
+)
+
+
+def remember_failure(key: str, error) -> None:
+    """Caches a 500 (no food / invalid JSON); provider outages are retried."""
+    if getattr(error, "status_code", None) == 500:
+        negative_cache.set(key, {"status_code": error.status_code, "detail": error.detail})
+
+def seed_food_index() -> None:
+    """Typo-tolerant lookup over the local table and its aliases, then learned foods."""
+    for name in list(FOODS) + list(FOOD_ALIASES):
+        if len(food_index) >= FUZZY_INDEX_MAX:
+            break
+        food_index.add(name)
+    if store is not None:
+        for key in store.keys("food", FUZZY_INDEX_MAX):
+            food_index.add(key)
+
+
+# Typo-tolerant lookup and autocomplete over every food we already have a
+# record for; the fuzzy index of a large table takes a while, so it's
+# seeded off the import path
+threading.Thread(target=seed_food_index, daemon=True).start()
+if store is not None:
+    suggest_index.add_many(store.keys("food", FUZZY_INDEX_MAX))
+
+# Optional paraphrase lookup; embedding the stored keys takes a while, so
+# it's seeded off the import path
+if semantic_index is not None and store is not None:
+    threading.Thread(
+        target=lambda: semantic_index.add_many(store.keys("food", SEMANTIC_INDEX_MAX)),
+        daemon=True,
+    ).start()
+
+
+def lookup_learned(parsed: dict, name: str):
+    record = find_record(name, food_cache)
+    return food_from_record(parsed, record) if record is not None else None
+
+
+def lookup_item(item_key: str):
+    """
+    Staged local lookup: exact item_cache hit, else the local food table,
+    else a learned per-100 g record for the food, else the record for the
+    closest spelling of a local or learned food, else (when enabled) for
+    the closest paraphrase. Aliases were already applied by
+    canonicalize_item. Records are scaled to the item's parsed quantity,
+    and the food's "source" names the stage that answered.
+    """
+    food = item_cache.get(item_key)
+    if food is not None:
+        return {**food, "source": "cache"}
+
+    food = food_from_db(item_key)
+    if food is not None:
+        record_event("food_db_hit")
+        return {**food, "source": "local"}
+
+    parsed = parse_quantity(item_key)
+    food = lookup_learned(parsed, parsed["food"])
+    if food is not None:
+        return {**food, "source": "learned"}
+
+    match = food_index.lookup(parsed["food"])
+    if match is not None and match != parsed["food"]:
+        # a misspelt local food or alias scales the table's record
+        record = find_food(canonical_food(match))
+        food = food_from_record(parsed, record) if record is not None else lookup_learned(parsed, match)
+        if food is not None:
+            return {**food, "source": "fuzzy"}
+        if record is None and food_cache.get(match) is None:
+            # expired since it was indexed
+            food_index.remove(match)
+            suggest_index.remove(match)
+
+    if semantic_index is not None:
+        match = semantic_index.lookup(parsed["food"])
+        if match is not None:
+            food = lookup_learned(parsed, match)
+            if food is not None:
+                semantic_index.served(parsed["food"], match)
+                return {**food, "source": "semantic"}
+            if food_cache.get(match) is None:
+                semantic_index.remove(match)
+
+    return None
+
+
+def remember_item(item_key: str, food: dict) -> None:
+    """
+    Stores an LLM answer as a per-100 g record under the requested food name
+    and the model's corrected name ("chiken biryani" and "chicken biryani").
+    Falls back to caching the exact answer when its weight is unknown.
+    """
+    parsed = parse_quantity(item_key)
+    record = record_from_answer(parsed, food)
+    food.pop("weight_g", None)
+
+    if record is None:
+        item_cache.set(item_key, {k: v for k, v in food.items() if k != "source"})
+        return
+
+    # one sample per answer for food_consolidation
+    log_sample({**record, "name": canonical_food(record["name"])})
+
+    for name in dict.fromkeys([parsed["food"], record["name"]]):
+        existing = food_cache.get(name)
+        if existing is not None and record["serving_g"] is None:
+            # answered by weight: keep the serving we already knew
+            record = {**record, "serving_g": existing["serving_g"], "serving_unit": existing["serving_unit"]}
+        food_cache.set(name, record)
+        food_index.add(name)
+        if semantic_index is not None:
+            semantic_index.add(name)
+    # autocomplete offers the model's spelling only
+    suggest_index.add(record["name"])
+
+
+# ===================== PER-ITEM RESOLUTION =====================
+def resolve_items(items: list, fetch_foods, chunk_size: int = FANOUT_CHUNK_SIZE,
+                  max_concurrency: int = FANOUT_CONCURRENCY) -> list:
+    """
+    Resolves every item locally via lookup_item() and sends the leftovers
+    to fetch_foods(missing_items), in chunks of `chunk_size` fetched
+    concurrently. Returns the foods in item order, each tagged with its
+    "source" ("cache", "local", "learned", "fuzzy", "semantic" or "llm");
+    answers a chunk couldn't attribute to its items are appended.
+    """
+    known, missing = {}, {}
+    lookup_items(items, known, missing)
+
+    extra_foods = []
+    for _, outcome in fetch_chunks(missing, fetch_foods, known, chunk_size, max_concurrency):
+        if isinstance(outcome, BaseException):
+            raise outcome
+        extra_foods += outcome
+    return foods_in_order(items, known) + extra_foods
+
+
+def resolve_item_lists(item_lists: list, fetch_foods, chunk_size: int,
+                       max_concurrency: int = FANOUT_CONCURRENCY) -> list:
+    """
+    resolve_items() for many inputs at once (e.g. a batch of meals). Items
+    missing anywhere are deduplicated across inputs and fetched in chunks
+    of `chunk_size`. A chunk whose answers don't line up with its items is
+    re-sent in smaller chunks, down to single items, whose answers are
+    then all theirs. Returns one entry per input: its foods, or the
+    exception its chunk failed with.
+    """
+    known, missing = {}, {}
+    for items in item_lists:
+        lookup_items(items, known, missing)
+
+    failed, extras = {}, {}
+    while missing:
+        retry = {}
+        for chunk, outcome in fetch_chunks(missing, fetch_foods, known, chunk_size, max_concurrency):
+            if isinstance(outcome, BaseException):
+                failed.update(dict.fromkeys(chunk, outcome))
+            elif outcome and len(chunk) == 1:
+                # one item answered as several foods
+                extras.update(dict.fromkeys(chunk, outcome))
+            elif outcome:
+                retry.update(chunk)
+        missing, chunk_size = retry, max(1, chunk_size // 4)
+
+    results = []
+    for items in item_lists:
+        keys = [canonicalize_item(item) for item in items]
+        errors = [failed[key] for key in keys if key in failed]
+        if errors:
+            results.append(errors[0])
+            continue
+        foods = foods_in_order(items, known)
+        for key in dict.fromkeys(keys):
+            foods += extras.get(key, [])
+        results.append(foods)
+    return results
+
+
+def fetch_chunks(missing: dict, fetch_foods, known: dict, chunk_size: int, max_concurrency: int) -> list:
+    """
+    fetch_missing() for each chunk of the missing items; a single chunk
+    runs inline, more run on fanout_executor, `max_concurrency` at a time.
+    Returns (chunk, unattributed answers or the exception) in chunk order.
+    """
+    pending = list(missing.items())
+    chunks = [dict(pending[start:start + chunk_size]) for start in range(0, len(pending), chunk_size)]
+
+    def run(chunk: dict):
+        try:
+            return fetch_missing(chunk, fetch_foods, known)
+        except Exception as e:
+            return e
+
+    if len(chunks) <= 1:
+        return [(chunk, run(chunk)) for chunk in chunks]
+
+    slots = threading.BoundedSemaphore(max_concurrency)
+
+    def run_in_slot(chunk: dict):
+        try:
+            return run(chunk)
+        finally:
+            slots.release()
+
+    futures = []
+    for chunk in chunks:
+        slots.acquire()
+        # carries current_endpoint into the worker for the LLM call metrics
+        context = contextvars.copy_context()
+        futures.append(fanout_executor.submit(context.run, run_in_slot, chunk))
+    return [(chunk, future.result()) for chunk, future in zip(chunks, futures)]
+
+
+async def aresolve_items(items: list, afetch_foods, chunk_size: int = FANOUT_CHUNK_SIZE,
+                         max_concurrency: int = FANOUT_CONCURRENCY) -> list:
+    """
+    resolve_items() for the event loop: `afetch_foods` is a coroutine
+    function, and chunks run as concurrent tasks instead of on threads.
+    The cache stages and learning answers read and write SQLite, the
+    sample log and (when enabled) the embedding model, so they run in a
+    worker thread.
+    """
+    known, missing = {}, {}
+    await asyncio.to_thread(lookup_items, items, known, missing)
+
+    pending = list(missing.items())
+    chunks = [dict(pending[start:start + chunk_size]) for start in range(0, len(pending), chunk_size)]
+    slots = asyncio.Semaphore(max_concurrency)
+
+    async def run(chunk: dict) -> list:
+        async with slots:
+            fetched = await afetch_foods(list(chunk.values()))
+        return await asyncio.to_thread(attribute_answers, chunk, fetched, known)
+
+    extra_foods = []
+    for unattributed in await asyncio.gather(*(run(chunk) for chunk in chunks)):
+        extra_foods += unattributed
+    return foods_in_order(items, known) + extra_foods
+
+
+def lookup_items(items: list, known: dict, missing: dict) -> None:
+    """Sorts items into known (item key -> food) and missing (item key -> item)."""
+    for item in items:
+        item_key = canonicalize_item(item)
+        if item_key in known or item_key in missing:
+            continue
+        food = lookup_item(item_key)
+        if food is None:
+            missing[item_key] = item
+        else:
+            known[item_key] = food
+            suggest_index.bump(str(food.get("food_name", "")))
+
+
+def fetch_missing(missing: dict, fetch_foods, known: dict) -> list:
+    """
+    One fetch_foods() call for the missing items. Answers are learned and
+    added to known; returns them instead when they can't be attributed.
+    """
+    return attribute_answers(missing, fetch_foods(list(missing.values())), known)
+
+
+def attribute_answers(missing: dict, fetched: list, known: dict) -> list:
+    for food in fetched:
+        food["source"] = "llm"
+
+    if len(fetched) != len(missing):
+        # Model merged or split items, answers can't be attributed per item
+        for food in fetched:
+            food.pop("weight_g", None)
+        return fetched
+
+    for item_key, food in zip(missing, fetched):
+        known[item_key] = food
+        remember_item(item_key, food)
+        suggest_index.bump(str(food.get("food_name", "")))
+    return []
+
+
+def foods_in_order(items: list, known: dict) -> list:
+    return [known[canonicalize_item(item)] for item in items if canonicalize_item(item) in known]
+
+
+# ===================== ADMIN =====================
+CACHE_TIERS = {
+    "meal": meal_cache,
+    "food": food_cache,
+    "item": item_cache,
+    "negative": negative_cache,
+}
+
+
+def endpoint_report() -> dict:
+    with _metrics_lock:
+        snapshot = {endpoint: dict(counts) for endpoint, counts in endpoint_stats.items()}
+
+    report = {}
+    for endpoint, counts in snapshot.items():
+        ratios = {}
+        for tier in CACHE_TIERS:
+            hit = counts.get(f"{tier}_hit", 0)
+            stale = counts.get(f"{tier}_stale", 0)
+            miss = counts.get(f"{tier}_miss", 0)
+            lookups = hit + stale + miss
+            if lookups:
+                ratios[tier] = {
+                    "hit_ratio": round(hit / lookups, 4),
+                    "stale_ratio": round(stale / lookups, 4),
+                    "miss_ratio": round(miss / lookups, 4),
+                }
+        report[endpoint] = {"counts": counts, "ratios": ratios}
+    return report
+
+
+def cache_report(top_n: int = 10) -> dict:
+    return {
+        "tiers": {
+            name: {**cache.stats(), "top_keys": cache.top_keys(top_n)}
+            for name, cache in CACHE_TIERS.items()
+        },
+        "fuzzy": {"size": len(food_index), "hits": food_index.hits, "misses": food_index.misses},
+        "semantic": semantic_index.stats() if semantic_index is not None else None,
+        "suggest": {"size": len(suggest_index)},
+        "endpoints": endpoint_report(),
+        "store": (
+            {"path": store.path, "bytes": store.size_bytes()} if store is not None else None
+        ),
+    }
+
+
+def invalidate_cached(food: str = None, prefix: str = None, tiers=None) -> dict:
+    """Drops one food (any quantity, and meals containing it) or a key prefix."""
+    if food:
+        kind, pattern = "food", canonicalize_item(food)
+    else:
+        kind, pattern = "prefix", canonicalize_item(prefix or "")
+    if not pattern:
+        raise ValueError("food or prefix is required")
+
+    removed = {}
+    for name in tiers or CACHE_TIERS:
+        removed[name] = CACHE_TIERS[name].invalidate(kind, pattern)
+
+    # an invalidated food that was answered from a semantic neighbour was a
+    # false match
+    false_matches = 0
+    if semantic_index is not None:
+        for key in semantic_index.served_keys():
+            if key_matches(kind, pattern, key) and semantic_index.report_false_match(key):
+                false_matches += 1
+    return {"kind": kind, "pattern": pattern, "removed": removed, "semantic_false_matches": false_matches}
+
+
+def flush_cache(tier: str) -> dict:
+    """Empties one tier ("meal", "item", "negative", "fuzzy", "semantic") or "all"."""
+    names = list(CACHE_TIERS) + ["fuzzy", "semantic"] if tier == "all" else [tier]
+    flushed = {}
+    for name in names:
+        if name in CACHE_TIERS:
+            flushed[name] = CACHE_TIERS[name].invalidate("all")
+        elif name == "fuzzy":
+            flushed[name] = len(food_index)
+            food_index.clear()
+            seed_food_index()
+        elif name == "semantic":
+            flushed[name] = len(semantic_index) if semantic_index is not None else 0
+            if semantic_index is not None:
+                semantic_index.clear()
+        else:
+            raise ValueError(f"Unknown cache tier: {name}")
+    return {"flushed": flushed}
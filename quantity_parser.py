@@ -0,0 +1,162 @@
+import re
+
+# ===================== VOCABULARY =====================
+WORD_NUMBERS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11,
+    "twelve": 12, "fifteen": 15, "twenty": 20, "dozen": 12,
+    "half": 0.5, "quarter": 0.25, "couple": 2, "few": 3,
+}
+
+UNICODE_FRACTIONS = {"½": 0.5, "¼": 0.25, "¾": 0.75, "⅓": 1 / 3, "⅔": 2 / 3}
+
+UNIT_ALIASES = {
+    "g": "g", "gm": "g", "gms": "g", "gr": "g", "gram": "g", "grams": "g", "grm": "g",
+    "kg": "kg", "kgs": "kg", "kilo": "kg", "kilos": "kg", "kilogram": "kg", "kilograms": "kg",
+    "ml": "ml", "millilitre": "ml", "millilitres": "ml", "milliliter": "ml", "milliliters": "ml",
+    "l": "l", "ltr": "l", "litre": "l", "litres": "l", "liter": "l", "liters": "l",
+    "cup": "cup", "cups": "cup",
+    "tbsp": "tbsp", "tablespoon": "tbsp", "tablespoons": "tbsp",
+    "tsp": "tsp", "teaspoon": "tsp", "teaspoons": "tsp",
+    "piece": "piece", "pieces": "piece", "pc": "piece", "pcs": "piece", "nos": "piece",
+    "bowl": "bowl", "bowls": "bowl",
+    "plate": "plate", "plates": "plate",
+    "katori": "katori", "katoris": "katori", "katories": "katori",
+    "glass": "glass", "glasses": "glass",
+    "slice": "slice", "slices": "slice",
+    "serving": "serving", "servings": "serving",
+    "scoop": "scoop", "scoops": "scoop",
+    "handful": "handful", "handfuls": "handful",
+    "can": "can", "cans": "can",
+    "pack": "pack", "packs": "pack", "packet": "pack", "packets": "pack",
+    "bar": "bar", "bars": "bar",
+}
+
+# Fixed weights; liquids are taken at 1 g per ml
+UNIT_GRAMS = {
+    "g": 1, "kg": 1000, "ml": 1, "l": 1000,
+    "cup": 240, "tbsp": 15, "tsp": 5, "glass": 250, "katori": 150,
+    "bowl": 200, "plate": 250, "slice": 30, "scoop": 30, "handful": 30,
+    "can": 330, "pack": 30, "bar": 40,
+}
+
+# Units that just count standard servings of the food
+COUNT_UNITS = {"piece", "serving"}
+
+# Serving units a count of pieces can multiply: "2 roti", "3 bread" (slices).
+# A count of a food served by measure counts pieces of an unknown weight:
+# "10 almonds" is not 10 handfuls
+PIECE_SERVINGS = {"piece", "serving", "slice", "bar"}
+
+# "i had two rotis" -> "two rotis"
+FILLER_PREFIXES = ("i had", "i ate", "i have eaten", "i've eaten", "had", "ate", "some")
+
+NUMBER_RE = re.compile(r"^\d+(?:\.\d+)?$|^\d+/\d+$")
+
+
+# ===================== PARSER =====================
+def parse_number(token: str):
+    if token in WORD_NUMBERS:
+        return float(WORD_NUMBERS[token])
+    if token in UNICODE_FRACTIONS:
+        return UNICODE_FRACTIONS[token]
+    if NUMBER_RE.match(token):
+        if "/" in token:
+            num, den = token.split("/")
+            return float(num) / float(den) if float(den) else None
+        return float(token)
+    return None
+
+
+def _leading_amount(tokens: list):
+    """(amount, tokens consumed) for "2", "1 1/2", "1½", "half"."""
+    if not tokens:
+        return None, 0
+    amount = parse_number(tokens[0])
+    if amount is None and tokens[0][-1:] in UNICODE_FRACTIONS:
+        whole = parse_number(tokens[0][:-1])
+        if whole is not None:
+            return whole + UNICODE_FRACTIONS[tokens[0][-1]], 1
+    if amount is None:
+        return None, 0
+    if len(tokens) > 1 and "/" in tokens[1] and amount == int(amount):
+        fraction = parse_number(tokens[1])
+        if fraction is not None and fraction < 1:
+            return amount + fraction, 2
+    return amount, 1
+
+
+def parse_quantity(item: str) -> dict:
+    """
+    {"food", "amount", "unit"} for a canonical item.
+    "200g rice", "rice 200 gm", "2 cups of rice", "a bowl of dal",
+    "half plate biryani", "1 1/2 roti", "roti x 2". unit is None for a
+    plain count.
+    """
+    text = item.lower().strip()
+    # "200g" -> "200 g", "1.5kg" -> "1.5 kg"
+    text = re.sub(r"(\d)([a-z])", r"\1 \2", text)
+    for prefix in FILLER_PREFIXES:
+        if text.startswith(prefix + " "):
+            text = text[len(prefix) + 1:]
+            break
+    tokens = text.split()
+
+    amount, unit = None, None
+
+    # ---- leading quantity: "2 cups of rice" ----
+    amount, used = _leading_amount(tokens)
+    if amount is not None:
+        tokens = tokens[used:]
+        if tokens and tokens[0] in UNIT_ALIASES:
+            unit = UNIT_ALIASES[tokens[0]]
+            tokens = tokens[1:]
+        if tokens and tokens[0] == "of":
+            tokens = tokens[1:]
+    elif len(tokens) > 1 and tokens[0] in UNIT_ALIASES and tokens[1] == "of":
+        # "bowl of dal"
+        amount, unit, tokens = 1.0, UNIT_ALIASES[tokens[0]], tokens[2:]
+
+    # ---- trailing quantity: "rice 200 g", "roti x 2" ----
+    # (a bare trailing number is part of the name: "chicken 65")
+    if amount is None and len(tokens) > 2:
+        trailing = parse_number(tokens[-2])
+        if tokens[-1] in UNIT_ALIASES and trailing is not None:
+            amount, unit, tokens = trailing, UNIT_ALIASES[tokens[-1]], tokens[:-2]
+        elif tokens[-2] == "x" and NUMBER_RE.match(tokens[-1]):
+            amount, tokens = parse_number(tokens[-1]), tokens[:-2]
+
+    if not tokens:
+        # only a quantity ("one"): keep the text as the name
+        return {"food": text, "amount": 1.0, "unit": None}
+
+    return {
+        "food": " ".join(tokens),
+        "amount": amount if amount is not None else 1.0,
+        "unit": unit,
+    }
+
+
+def format_quantity(parsed: dict) -> str:
+    """Canonical text: "200 g rice", "2 roti", "dal" (a single serving)."""
+    amount, unit, food = parsed["amount"], parsed["unit"], parsed["food"]
+    if unit is not None:
+        return f"{amount:g} {unit} {food}".strip()
+    if amount != 1:
+        return f"{amount:g} {food}".strip()
+    return food
+
+
+def to_grams(parsed: dict, serving_g: float, serving_unit: str):
+    """
+    Weight of a parsed item, given the food's standard serving. None when
+    it can't be told: a count of a food with no known serving, or of a food
+    served by measure ("15 grapes" against a bowl). A bare food name ("dal")
+    is still one serving.
+    """
+    unit, amount = parsed["unit"], parsed["amount"]
+    if unit in (None, "piece") and serving_unit not in PIECE_SERVINGS and (unit or amount != 1):
+        return None
+    if unit is None or unit in COUNT_UNITS or unit == serving_unit:
+        return amount * serving_g if serving_g is not None else None
+    return amount * UNIT_GRAMS[unit]
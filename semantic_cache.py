@@ -0,0 +1,231 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Optional tier: needs numpy + sentence-transformers (hnswlib for large indexes)
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    np = None
+    SentenceTransformer = None
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# ===================== CONFIG =====================
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_MODEL = os.getenv("SEMANTIC_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+SEMANTIC_THRESHOLD = float(os.getenv("SEMANTIC_THRESHOLD", "0.9"))
+# Switch from a flat NumPy scan to HNSW past this many vectors
+SEMANTIC_HNSW_MIN = int(os.getenv("SEMANTIC_HNSW_MIN", "5000"))
+SEMANTIC_INDEX_MAX = int(os.getenv("SEMANTIC_INDEX_MAX", "100000"))
+
+DIGITS_RE = re.compile(r"[\d./]+")
+# Recent (query, neighbour) pairs kept so a later invalidation can be
+# traced back to a false match
+SERVED_TRACKED = 5000
+
+
+# ===================== SEMANTIC CACHE =====================
+class SemanticCache:
+    """
+    Nearest-neighbour lookup over embeddings of cached item keys, for
+    paraphrases the fuzzy index can't catch ("curd rice one bowl").
+
+    Counters for tuning SEMANTIC_THRESHOLD:
+    - hits / misses: lookups that did / didn't return a neighbour
+    - false_matches: neighbours above the threshold that were wrong, either
+      rejected because their quantities differ or reported afterwards (an
+      admin invalidated a food that was answered from its neighbour)
+    """
+
+    def __init__(
+        self,
+        model_name: str = SEMANTIC_MODEL,
+        threshold: float = SEMANTIC_THRESHOLD,
+        hnsw_min: int = SEMANTIC_HNSW_MIN,
+        max_keys: int = SEMANTIC_INDEX_MAX,
+    ):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.hnsw_min = hnsw_min
+        self.max_keys = max_keys
+        self.hits = 0
+        self.misses = 0
+        self.false_matches = 0
+
+        self._model = None
+        self._keys = []
+        self._positions = {}
+        self._removed = set()
+        self._vectors = None
+        self._hnsw = None
+        self._served = OrderedDict()
+        self._rejected = set()
+        self._lock = threading.Lock()
+
+    # ---- EMBEDDING ----
+    def _embed(self, texts: list):
+        if self._model is None:
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+        vectors = self._model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return vectors.astype(np.float32)
+
+    # ---- INDEX ----
+    def add_many(self, keys: list) -> None:
+        with self._lock:
+            for key in keys:
+                if key in self._removed:
+                    self._restore(key)
+        keys = [k for k in dict.fromkeys(keys) if k not in self._positions]
+        if not keys:
+            return
+        vectors = self._embed(keys)
+
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                if key in self._positions or len(self._keys) >= self.max_keys:
+                    continue
+                self._append(key, vector)
+
+    def add(self, key: str) -> None:
+        self.add_many([key])
+
+    def _append(self, key: str, vector) -> None:
+        position = len(self._keys)
+        if self._vectors is None:
+            self._vectors = np.zeros((64, len(vector)), dtype=np.float32)
+        elif position == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+
+        self._vectors[position] = vector
+        self._keys.append(key)
+        self._positions[key] = position
+
+        if self._hnsw is not None:
+            self._hnsw.add_items(vector[None, :], [position])
+        elif hnswlib is not None and len(self._keys) >= self.hnsw_min:
+            self._build_hnsw()
+
+    def _build_hnsw(self) -> None:
+        index = hnswlib.Index(space="ip", dim=self._vectors.shape[1])
+        index.init_index(max_elements=self.max_keys, ef_construction=200, M=16)
+        index.add_items(self._vectors[: len(self._keys)], list(range(len(self._keys))))
+        for key in self._removed:
+            index.mark_deleted(self._positions[key])
+        index.set_ef(64)
+        self._hnsw = index
+
+    def _restore(self, key: str) -> None:
+        self._removed.discard(key)
+        if self._hnsw is not None:
+            self._hnsw.unmark_deleted(self._positions[key])
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None or key in self._removed:
+                return
+            self._removed.add(key)
+            if self._hnsw is not None:
+                self._hnsw.mark_deleted(position)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys = []
+            self._positions = {}
+            self._removed = set()
+            self._vectors = None
+            self._hnsw = None
+
+    # ---- SEARCH ----
+    def lookup(self, key: str):
+        """Cached key most similar to `key` above the threshold, or None."""
+        if not self._keys:
+            self.misses += 1
+            return None
+
+        vector = self._embed([key])[0]
+
+        with self._lock:
+            if self._hnsw is not None:
+                labels, distances = self._hnsw.knn_query(vector, k=1)
+                position, score = int(labels[0][0]), 1.0 - float(distances[0][0])
+            else:
+                scores = self._vectors[: len(self._keys)] @ vector
+                for removed in self._removed:
+                    scores[self._positions[removed]] = -1.0
+                position = int(np.argmax(scores))
+                score = float(scores[position])
+            match = self._keys[position]
+
+        if score < self.threshold or match in self._removed or (key, match) in self._rejected:
+            self.misses += 1
+            return None
+
+        # "2 idli" and "4 idli" embed almost identically
+        if DIGITS_RE.findall(match) != DIGITS_RE.findall(key):
+            self.false_matches += 1
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return match
+
+    def served(self, key: str, match: str) -> None:
+        """Records that `key` was answered from its neighbour `match`."""
+        with self._lock:
+            self._served[key] = match
+            self._served.move_to_end(key)
+            if len(self._served) > SERVED_TRACKED:
+                self._served.popitem(last=False)
+
+    def served_keys(self) -> list:
+        with self._lock:
+            return list(self._served)
+
+    def report_false_match(self, key: str) -> bool:
+        """
+        The answer served for `key` turned out wrong: count it and never
+        answer `key` from that neighbour again. False if `key` wasn't
+        answered from a neighbour.
+        """
+        with self._lock:
+            match = self._served.pop(key, None)
+            if match is None:
+                return False
+            self._rejected.add((key, match))
+            self.false_matches += 1
+        return True
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._keys) - len(self._removed),
+            "index": "hnsw" if self._hnsw is not None else "flat",
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "false_matches": self.false_matches,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._keys) - len(self._removed)
+
+
+def create_semantic_cache():
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    if SentenceTransformer is None:
+        print("⚠️ SEMANTIC CACHE DISABLED: install numpy and sentence-transformers")
+        return None
+    return SemanticCache()
+
+
+# None unless SEMANTIC_CACHE=1 and its dependencies are installed
+semantic_index = create_semantic_cache()
@@ -0,0 +1,88 @@
+import copy
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+# ===================== SINGLE FLIGHT =====================
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution.
+    The first caller runs `fn`; callers arriving while it is in flight
+    wait on its Future and get a copy of the same result or exception.
+    The key is released as soon as the call finishes, so a failure is
+    never reused by later calls.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.shared += 1
+
+        if not leader:
+            return copy.deepcopy(future.result())
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop: the first caller awaits
+    `fn`, later callers with the same key await its task.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._inflight = {}
+
+    async def do(self, key: str, fn, *args, **kwargs):
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+            # shield: a cancelled waiter must not cancel the leader's call
+            return copy.deepcopy(await asyncio.shield(task))
+
+        task = asyncio.ensure_future(fn(*args, **kwargs))
+        self._inflight[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._inflight.pop(key, None)
+            else:
+                task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+
+# Nutrition lookups keyed on the canonical input
+nutrition_flight = SingleFlight()
+anutrition_flight = AsyncSingleFlight()
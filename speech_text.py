@@ -2,6 +2,8 @@ import os
 from deepgram import DeepgramClient
 from dotenv import load_dotenv
 
+from work_limits import transcription_limit
+
 load_dotenv()
 
 DG_API_KEY = os.getenv("DEEPGRAM_API_KEY")
@@ -10,25 +12,32 @@ if not DG_API_KEY:
 
 client = DeepgramClient(DG_API_KEY)
 
-def transcribe_audio(file_path: str) -> str:
-    """
-    Transcribes audio using Deepgram SDK v5.x
-    """
-    with open(file_path, "rb") as audio:
-        response = client.listen.rest.transcribe_file(
-            audio,
-            {
-                "model": "nova-2",
-                "language": "en",
-                "punctuate": True,
-                "smart_format": True,
-                "encoding": "linear16",
-                "sample_rate": 16000,
-                "channels": 1,
-            }
-        )
+TRANSCRIBE_OPTIONS = {
+    "model": "nova-2",
+    "language": "en",
+    "punctuate": True,
+    "smart_format": True,
+    "encoding": "linear16",
+    "sample_rate": 16000,
+    "channels": 1,
+}
+
 
+def read_transcript(response) -> str:
     transcript = response["results"]["channels"][0]["alternatives"][0]["transcript"]
     print("🧠 Deepgram transcript:", repr(transcript))
 
     return transcript.strip() if transcript else ""
+
+
+async def transcribe_audio(file_path: str) -> str:
+    """
+    Transcribes audio using Deepgram's async REST client (SDK v3.x)
+    """
+    with open(file_path, "rb") as audio:
+        data = audio.read()
+
+    async with transcription_limit:
+        response = await client.listen.asyncrest.v("1").transcribe_file({"buffer": data}, TRANSCRIBE_OPTIONS)
+
+    return read_transcript(response)
@@ -1,107 +1,72 @@
-import os
-import json
-from fastapi import HTTPException
-from dotenv import load_dotenv
-
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-
-# ================= ENV =================
-load_dotenv()
-
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise RuntimeError("❌ GROQ_API_KEY not found")
-
-MAX_FOODS = 10
-
-# ================= JSON SAFETY =================
-def safe_json_parse(text: str) -> dict:
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        start = text.find("{")
-        end = text.rfind("}") + 1
-        if start != -1 and end != -1:
-            try:
-                return json.loads(text[start:end])
-            except Exception:
-                pass
-    raise HTTPException(status_code=500, detail="Invalid JSON from AI")
-
-# ================= PROMPT =================
-prompt = ChatPromptTemplate.from_messages([
-    (
-        "system",
-        f"""
-You are a professional nutrition assistant.
-
-Rules:
-1. Max {MAX_FOODS} foods
-2. Fix spelling mistakes
-3. Use real foods only
-4. Use quantity if present else standard serving
-5. Return ONLY JSON
+import asyncio
 
-Format:
-{{
-  "foods": [
-    {{
-      "food_name": "",
-      "quantity": "",
-      "carbohydrates_g": 0,
-      "protein_g": 0,
-      "fat_g": 0,
-      "calories_kcal": 0
-    }}
-  ]
-}}
-"""
-    ),
-    ("human", "Food input: {food_input}")
-])
+from fastapi import HTTPException
 
-parser = StrOutputParser()
+from nutrition_cache import (
+    canonicalize_food_input,
+    split_food_items,
+    aresolve_items,
+    negative_cache,
+    remember_failure,
+)
+from single_flight import anutrition_flight
+from nutrient_matrix import nutrient_totals
+# same numbered prompt as text search, so answers line up with their items
+from Type_Search import aquery_llm_items
 
 # ================= CORE FUNCTION =================
-def get_voice_nutrition(food_input: str) -> dict:
-    try:
-        llm = ChatGroq(
-            model="llama-3.1-8b-instant",
-            groq_api_key=GROQ_API_KEY,
-            temperature=0,
-            max_tokens=700,
-            timeout=40,
-        )
+def voice_failure(cache_key: str):
+    """Fast answer for a known-bad transcript, None otherwise."""
+    failure = negative_cache.get(cache_key)
+    if failure is None:
+        return None
+    if failure["detail"] == "No food detected":
+        return {"foods": [], "total_nutrition": {}}
+    raise HTTPException(
+        status_code=503,
+        detail="Nutrition service temporarily unavailable"
+    )
+
+
+async def get_voice_nutrition(food_input: str) -> dict:
+    cache_key = "voice:" + canonicalize_food_input(food_input)
+
+    # Known-bad transcripts fail fast
+    failed = await asyncio.to_thread(voice_failure, cache_key)
+    if failed is not None:
+        return failed
+
+    # Concurrent identical transcripts share one lookup
+    return await anutrition_flight.do(cache_key, resolve_voice_nutrition, food_input, cache_key)
+
+
+def voice_result(foods: list, cache_key: str) -> dict:
+    if not foods:
+        remember_failure(cache_key, HTTPException(status_code=500, detail="No food detected"))
+        return {
+            "foods": [],
+            "total_nutrition": {}
+        }
 
-        chain = prompt | llm | parser
-        response = chain.invoke({"food_input": food_input})
+    return {
+        "foods": foods,
+        "total_nutrition": nutrient_totals(foods)
+    }
 
-        data = safe_json_parse(response)
-        foods = data.get("foods", [])
 
-        if not foods:
-            return {
-                "foods": [],
-                "total_nutrition": {}
-            }
+def voice_unavailable(cache_key: str, error: Exception) -> HTTPException:
+    remember_failure(cache_key, error)
+    print("❌ GROQ ERROR:", repr(error))
+    return HTTPException(
+        status_code=503,
+        detail="Nutrition service temporarily unavailable"
+    )
 
-        total = {
-            "carbohydrates_g": round(sum(f.get("carbohydrates_g", 0) for f in foods), 2),
-            "protein_g": round(sum(f.get("protein_g", 0) for f in foods), 2),
-            "fat_g": round(sum(f.get("fat_g", 0) for f in foods), 2),
-            "calories_kcal": round(sum(f.get("calories_kcal", 0) for f in foods), 2),
-        }
 
-        return {
-            "foods": foods,
-            "total_nutrition": total
-        }
+async def resolve_voice_nutrition(food_input: str, cache_key: str) -> dict:
+    try:
+        foods = await aresolve_items(split_food_items(food_input), aquery_llm_items)
+        return await asyncio.to_thread(voice_result, foods, cache_key)
 
     except Exception as e:
-        print("❌ GROQ ERROR:", repr(e))
-        raise HTTPException(
-            status_code=503,
-            detail="Nutrition service temporarily unavailable"
-        )
+        raise await asyncio.to_thread(voice_unavailable, cache_key, e)
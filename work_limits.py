@@ -0,0 +1,106 @@
+import os
+import time
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+# ===================== CONFIG =====================
+# Provider calls of each kind allowed in flight at once
+VISION_CONCURRENCY = int(os.getenv("VISION_CONCURRENCY", "4"))
+TRANSCRIPTION_CONCURRENCY = int(os.getenv("TRANSCRIPTION_CONCURRENCY", "4"))
+NUTRITION_LLM_CONCURRENCY = int(os.getenv("NUTRITION_LLM_CONCURRENCY", "16"))
+CHAT_CONCURRENCY = int(os.getenv("CHAT_CONCURRENCY", "8"))
+
+# Calls allowed to wait for a slot; past this a request gets a 503 at once
+# instead of queueing behind a burst
+VISION_QUEUE_MAX = int(os.getenv("VISION_QUEUE_MAX", "16"))
+TRANSCRIPTION_QUEUE_MAX = int(os.getenv("TRANSCRIPTION_QUEUE_MAX", "16"))
+NUTRITION_LLM_QUEUE_MAX = int(os.getenv("NUTRITION_LLM_QUEUE_MAX", "64"))
+CHAT_QUEUE_MAX = int(os.getenv("CHAT_QUEUE_MAX", "32"))
+
+
+# ===================== LIMITER =====================
+class WorkLimiter:
+    """
+    Named concurrency limit for one class of provider work. Coroutines
+    take a slot with `async with limiter:`; blocking work goes through
+    run_sync(), which also takes a slot and runs on the class's own thread
+    pool. A slow class fills only its own slots and queue, so it can't
+    hold up the others.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.active = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.started = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self._slots = None
+        self._executor = ThreadPoolExecutor(max_workers=self.limit, thread_name_prefix=name)
+
+    async def __aenter__(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.limit)
+
+        if self._slots.locked() and self.queued >= self.max_queue:
+            self.rejected += 1
+            print(f"⚠️ {self.name.upper()} BUSY: {self.active} active, {self.queued} queued")
+            raise HTTPException(
+                status_code=503,
+                detail=f"Too many {self.name} requests, try again shortly"
+            )
+
+        start = time.monotonic()
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.wait_seconds += time.monotonic() - start
+        self.started += 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.active -= 1
+        self.completed += 1
+        self._slots.release()
+        return False
+
+    async def run_sync(self, fn, *args):
+        # the request's contextvars (current_endpoint) follow it to the thread
+        context = contextvars.copy_context()
+        async with self:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, context.run, fn, *args)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "peak_queued": self.peak_queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_seconds / self.started * 1000, 1) if self.started else 0.0,
+        }
+
+
+vision_limit = WorkLimiter("vision", VISION_CONCURRENCY, VISION_QUEUE_MAX)
+transcription_limit = WorkLimiter("transcription", TRANSCRIPTION_CONCURRENCY, TRANSCRIPTION_QUEUE_MAX)
+nutrition_llm_limit = WorkLimiter("nutrition-llm", NUTRITION_LLM_CONCURRENCY, NUTRITION_LLM_QUEUE_MAX)
+chat_limit = WorkLimiter("chat", CHAT_CONCURRENCY, CHAT_QUEUE_MAX)
+
+LIMITERS = (vision_limit, transcription_limit, nutrition_llm_limit, chat_limit)
+
+
+def limits_report() -> dict:
+    return {limiter.name: limiter.stats() for limiter in LIMITERS}